@@ -0,0 +1,201 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import os
+import time
+import pandas as pd
+from data_io.connections import cursor, transaction
+from data_io.data_io import file_sha256
+from model_registry import InferenceEngine, ModelRegistry, load_model
+from prediction import INPUT_DIR, OUTPUT_DIR, get_predictions
+
+LEDGER_DB_PATH = "datasets/predict/ledger.db"
+LEDGER_TABLE_NAME = "prediction_ledger"
+
+worker_model = None
+worker_predictors = None
+
+
+def init_worker(model_path: str, predictors: list):
+    global worker_model, worker_predictors
+    worker_model = load_model(model_path)
+    worker_predictors = predictors
+
+
+def score_chunk(chunk_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Run predictions on a chunk of rows with the model loaded by the worker process.
+    """
+    return get_predictions(worker_model, chunk_df, worker_predictors)
+
+
+def create_ledger_table(ledger_db_path: str) -> None:
+    with cursor(ledger_db_path) as con:
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {LEDGER_TABLE_NAME}(
+              input_file VARCHAR,
+              sha256 VARCHAR,
+              size BIGINT,
+              mtime DOUBLE,
+              run_id VARCHAR,
+              output_file VARCHAR,
+              rows BIGINT,
+              processed_at TIMESTAMP
+            );
+            """)
+
+
+def get_pending_files(input_dir: str, ledger_db_path: str, run_id: str) -> list:
+    """
+    Find the .csv files of the input directory that have not been scored yet by the
+    model of a training run.
+
+    Files whose size and mtime match the ledger are skipped without being read,
+    files whose content was already scored are skipped after hashing.
+
+    Args:
+        input_dir (str): The directory of the files to predict.
+        ledger_db_path (str): The path to the DuckDB database holding the ledger.
+        run_id (str): The ID of the training run of the model.
+
+    Returns:
+        list: (file name, sha256, size, mtime) of every pending file, oldest first.
+    """
+    with cursor(ledger_db_path) as con:
+        processed = con.execute(
+            f"SELECT input_file, sha256, size, mtime FROM {LEDGER_TABLE_NAME} WHERE run_id = ?",
+            [run_id],
+        ).fetchall()
+    scored_stats = {(f, size, mtime) for f, _, size, mtime in processed}
+    scored_hashes = {(f, sha256) for f, sha256, _, _ in processed}
+
+    csv_files = [f for f in os.listdir(input_dir) if f.endswith(".csv")]
+    pending = []
+    for input_file in sorted(
+        csv_files, key=lambda f: os.path.getmtime(os.path.join(input_dir, f))
+    ):
+        stat = os.stat(os.path.join(input_dir, input_file))
+        if (input_file, stat.st_size, stat.st_mtime) in scored_stats:
+            continue
+        sha256 = file_sha256(os.path.join(input_dir, input_file))
+        if (input_file, sha256) in scored_hashes:
+            continue
+        pending.append((input_file, sha256, stat.st_size, stat.st_mtime))
+    return pending
+
+
+def score_file(
+    executor: ProcessPoolExecutor,
+    input_path: str,
+    output_path: str,
+    chunk_size: int,
+    max_pending_chunks: int,
+) -> int:
+    """
+    Stream a file in chunks through the process pool and append the predictions of
+    every chunk to the output file in input order, keeping at most max_pending_chunks
+    chunks in memory.
+
+    The predictions are written to a .part file that is renamed once complete, so an
+    interrupted run never leaves an output file that looks finished.
+
+    Returns:
+        int: The number of scored rows.
+    """
+    partial_path = output_path + ".part"
+    pending = deque()
+    rows = 0
+    header = True
+
+    def write_next():
+        nonlocal header
+        pred_df = pending.popleft().result()
+        pred_df.to_csv(
+            partial_path, mode="w" if header else "a", header=header, index=False
+        )
+        header = False
+        return len(pred_df)
+
+    for chunk_df in pd.read_csv(input_path, chunksize=chunk_size):
+        pending.append(executor.submit(score_chunk, chunk_df))
+        if len(pending) >= max_pending_chunks:
+            rows += write_next()
+    while pending:
+        rows += write_next()
+    if header:
+        # an input file without rows still gets its (empty) output file
+        open(partial_path, "w").close()
+    os.replace(partial_path, output_path)
+    return rows
+
+
+def score_pending_files(
+    input_dir: str = INPUT_DIR,
+    output_dir: str = OUTPUT_DIR,
+    run_id: str = None,
+    inference_engine: InferenceEngine = InferenceEngine.SCORER,
+    ledger_db_path: str = LEDGER_DB_PATH,
+    chunk_size: int = 50_000,
+    max_workers: int = None,
+) -> None:
+    """
+    Run predictions on every input file that was not scored yet.
+
+    The files are read in chunks that are scored on a process pool, each worker
+    loading the model once. Every scored file is recorded in a ledger with its hash,
+    size, mtime and the training run of the model, so reruns only score new or
+    changed files, or files not scored by that run yet.
+
+    Args:
+        input_dir (str): The directory of the files to predict.
+        output_dir (str): The directory to save the predictions to.
+        run_id (str): The ID of the training run, the latest registered run when None.
+        inference_engine (InferenceEngine): Whether to score with the pickled model
+            or its exported scorer.
+        ledger_db_path (str): The path to the DuckDB database holding the ledger.
+        chunk_size (int): Number of rows scored at a time.
+        max_workers (int): Number of worker processes, one per CPU when None.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    create_ledger_table(ledger_db_path)
+    registry = ModelRegistry()
+    run_id, model_path, predictors = registry.resolve(run_id, inference_engine)
+    registry.close()
+
+    pending_files = get_pending_files(input_dir, ledger_db_path, run_id)
+    if not pending_files:
+        print(f"No new .csv files to score with the model of run {run_id}.")
+        return
+    print(f"Scoring {len(pending_files)} files with the model of run {run_id}.")
+
+    max_workers = max_workers or os.cpu_count()
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_worker,
+        initargs=(model_path, predictors),
+    ) as executor:
+        for input_file, sha256, size, mtime in pending_files:
+            start = time.perf_counter()
+            timestamp_millis = str(int(time.time() * 1000))
+            output_file = input_file[:-4] + "_predictions_" + timestamp_millis + ".csv"
+            rows = score_file(
+                executor,
+                os.path.join(input_dir, input_file),
+                os.path.join(output_dir, output_file),
+                chunk_size,
+                2 * max_workers,
+            )
+            with transaction(ledger_db_path) as con:
+                con.execute(
+                    f"INSERT INTO {LEDGER_TABLE_NAME} "
+                    "(input_file, sha256, size, mtime, output_file, rows, processed_at, run_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, current_timestamp, ?)",
+                    [input_file, sha256, size, mtime, output_file, rows, run_id],
+                )
+            print(
+                f"Scored {rows} rows of {input_file} into {output_file} in {time.perf_counter() - start:.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    score_pending_files()
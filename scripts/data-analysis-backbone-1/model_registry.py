@@ -0,0 +1,220 @@
+from enum import Enum
+import os
+import pickle
+import pandas as pd
+from data_io.connections import close_connection, cursor, transaction
+from data_io.data_io import file_sha256
+from ordinal_scorer import export_scorer, load_scorer
+
+TRACE_DB_PATH = "datasets/trace/data-governance.db"
+MODEL_PATH = "datasets/predict/model/model.pkl"
+MODEL_CACHE_DIR = "datasets/predict/model/cache"
+REGISTRY_TABLE_NAME = "model_registry"
+
+
+class InferenceEngine(Enum):
+    STATSMODELS = 1
+    SCORER = 2
+
+
+def load_model(model_path: str = MODEL_PATH):
+    if model_path.endswith(".npz"):
+        print("Loading exported scorer.")
+        return load_scorer(model_path)
+    print("Loading model from pickle file.")
+    with open(model_path, "rb") as f:
+        model = pickle.load(f)
+    print("Model loaded.")
+    return model
+
+
+class ModelRegistry:
+    """
+    Registry of training runs in the tracing database, binding a model artifact,
+    by its SHA-256, to the model_training trace it was trained from, found as the
+    only trace with the parameters of the model.
+
+    Loading a run checks the artifact against the registered hash and the trace
+    against its registered fingerprint, so a model can never be used with the
+    predictors of another training. When no run is registered, the model at
+    MODEL_PATH is registered on first use. Loaded models are cached in memory by run ID,
+    and exported scorers on local disk, so switching runs is free after first load.
+    """
+
+    def __init__(
+        self, trace_db_path: str = TRACE_DB_PATH, cache_dir: str = MODEL_CACHE_DIR
+    ) -> None:
+        self.trace_db_path: str = trace_db_path
+        self.cache_dir: str = cache_dir
+        self._models: dict = {}
+        with cursor(trace_db_path) as con:
+            con.execute(f"""
+                CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE_NAME}(
+                  run_id VARCHAR PRIMARY KEY,
+                  model_path VARCHAR,
+                  artifact_sha256 VARCHAR,
+                  model_params VARCHAR,
+                  trace_fingerprint UBIGINT,
+                  predictors VARCHAR[],
+                  registered_at TIMESTAMP
+                );
+                """)
+
+    def _trace(self, model_params: str) -> tuple:
+        """
+        Find the model_training trace of a model by its parameters.
+
+        Raises:
+            ValueError: If no trace or more than one trace has the parameters.
+
+        Returns:
+            tuple: The fingerprint of the trace and its predictors.
+        """
+        with cursor(self.trace_db_path) as con:
+            traces = con.execute(
+                "SELECT hash(t), t.predictors FROM model_training t WHERE t.model_params = ?",
+                [model_params],
+            ).fetchall()
+        if len(traces) != 1:
+            raise ValueError(
+                f"Expected one model_training trace with the model parameters, found {len(traces)}"
+            )
+        return traces[0]
+
+    def register(self, model_path: str = MODEL_PATH, run_id: str = None) -> str:
+        """
+        Register a model artifact as the result of the model_training trace with
+        the parameters of the model.
+
+        Registering the same artifact again returns the existing run.
+
+        Args:
+            model_path (str): The path to the pickled model.
+            run_id (str): The ID of the run, derived from the artifact hash when None.
+
+        Raises:
+            ValueError: If not exactly one trace has the parameters of the model.
+
+        Returns:
+            str: The ID of the run.
+        """
+        artifact_sha256 = file_sha256(model_path)
+        if run_id is None:
+            run_id = artifact_sha256[:12]
+        runs = self.runs()
+        existing = runs[runs["run_id"] == run_id]
+        if len(existing):
+            run = existing.iloc[0]
+            if run["artifact_sha256"] != artifact_sha256:
+                raise ValueError(f"Run {run_id} is registered with another artifact")
+            return run_id
+
+        model = load_model(model_path)
+        model_params = str(model.params)
+        trace_fingerprint, predictors = self._trace(model_params)
+        with transaction(self.trace_db_path) as con:
+            con.execute(
+                f"INSERT INTO {REGISTRY_TABLE_NAME} VALUES (?, ?, ?, ?, ?, ?, current_timestamp)",
+                [
+                    run_id,
+                    model_path,
+                    artifact_sha256,
+                    model_params,
+                    trace_fingerprint,
+                    list(predictors),
+                ],
+            )
+        self._models[(run_id, InferenceEngine.STATSMODELS)] = (model, list(predictors))
+        print(f"Registered {model_path} as run {run_id}.")
+        return run_id
+
+    def runs(self) -> pd.DataFrame:
+        with cursor(self.trace_db_path) as con:
+            return con.execute(
+                f"SELECT * FROM {REGISTRY_TABLE_NAME} ORDER BY registered_at"
+            ).df()
+
+    def latest_run_id(self) -> str:
+        """
+        Get the latest registered run, registering the model at MODEL_PATH with the
+        trace matching its parameters when no run is registered yet, so every entry
+        point works on a fresh tracing database.
+        """
+        runs = self.runs()
+        if runs.empty:
+            print("No model is registered yet.")
+            return self.register()
+        return runs["run_id"].iloc[-1]
+
+    def close(self) -> None:
+        """
+        Release the connection to the tracing database, so long-running processes
+        do not hold its lock once their model is loaded.
+        """
+        close_connection(self.trace_db_path)
+
+    def resolve(
+        self, run_id: str = None, engine: InferenceEngine = InferenceEngine.SCORER
+    ) -> tuple:
+        """
+        Check a run against its registration and find the file to load its model from,
+        exporting its scorer into the cache directory on first use.
+
+        Args:
+            run_id (str): The ID of the run, the latest registered run when None.
+            engine (InferenceEngine): Whether to load the pickled model or its scorer.
+
+        Raises:
+            ValueError: If the run is unknown, or its artifact or trace changed since
+                it was registered.
+
+        Returns:
+            tuple: The run ID, the path to load the model from and the predictors.
+        """
+        run_id = self.latest_run_id() if run_id is None else run_id
+        runs = self.runs()
+        matching = runs[runs["run_id"] == run_id]
+        if matching.empty:
+            raise ValueError(f"Unknown run {run_id}")
+        run = matching.iloc[0]
+        predictors = list(run["predictors"])
+        if self._trace(run["model_params"])[0] != run["trace_fingerprint"]:
+            raise ValueError(f"The model_training trace of run {run_id} changed")
+
+        scorer_path = os.path.join(self.cache_dir, f"{run_id}.npz")
+        if engine == InferenceEngine.SCORER and os.path.exists(scorer_path):
+            return run_id, scorer_path, predictors
+        if file_sha256(run["model_path"]) != run["artifact_sha256"]:
+            raise ValueError(f"The model artifact of run {run_id} changed")
+        if engine == InferenceEngine.STATSMODELS:
+            return run_id, run["model_path"], predictors
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        model = self._models.get((run_id, InferenceEngine.STATSMODELS), (None,))[0]
+        model = load_model(run["model_path"]) if model is None else model
+        # written under a temporary name, so a cached scorer is always complete
+        export_scorer(model, predictors).save(scorer_path + ".tmp.npz")
+        os.replace(scorer_path + ".tmp.npz", scorer_path)
+        print(f"Cached scorer of run {run_id} in {scorer_path}.")
+        return run_id, scorer_path, predictors
+
+    def load(
+        self, run_id: str = None, engine: InferenceEngine = InferenceEngine.SCORER
+    ) -> tuple:
+        """
+        Load the model of a run, from memory after the first load.
+
+        Args:
+            run_id (str): The ID of the run, the latest registered run when None.
+            engine (InferenceEngine): Whether to load the pickled model or its scorer.
+
+        Returns:
+            tuple: The run ID, the model and its predictors.
+        """
+        run_id = self.latest_run_id() if run_id is None else run_id
+        if (run_id, engine) not in self._models:
+            run_id, model_path, predictors = self.resolve(run_id, engine)
+            self._models[(run_id, engine)] = (load_model(model_path), predictors)
+        model, predictors = self._models[(run_id, engine)]
+        return run_id, model, predictors
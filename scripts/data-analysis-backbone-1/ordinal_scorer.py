@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+
+class OrdinalScorer:
+    """
+    Inference-only copy of a fitted ordinal probit model, holding just the
+    coefficients, the thresholds between the levels and the predictor names.
+
+    The probability of level k is Phi(t_k - x @ b) - Phi(t_(k-1) - x @ b), computed
+    for all rows with one matrix product, so scoring needs neither statsmodels nor
+    its pandas wrappers.
+    """
+
+    def __init__(
+        self, coefficients: np.ndarray, thresholds: np.ndarray, predictors: list
+    ) -> None:
+        self.coefficients: np.ndarray = np.asarray(coefficients, dtype=float)
+        self.thresholds: np.ndarray = np.asarray(thresholds, dtype=float)
+        self.predictors: list = list(predictors)
+
+    def predict_proba(self, values: np.ndarray) -> np.ndarray:
+        """
+        Compute the probability of every level for rows of predictor values.
+
+        Args:
+            values (np.ndarray): One row per observation, one column per predictor.
+
+        Returns:
+            np.ndarray: One row per observation, one column per level.
+        """
+        linear = np.asarray(values, dtype=float) @ self.coefficients
+        cdf = ndtr(self.thresholds[np.newaxis, :] - linear[:, np.newaxis])
+        return np.diff(cdf, axis=1)
+
+    def predict(self, exog: pd.DataFrame) -> pd.DataFrame:
+        """
+        Compute the probability of every level, in the shape the predict method of
+        the statsmodels results returns for a DataFrame.
+        """
+        return pd.DataFrame(
+            self.predict_proba(exog[self.predictors].to_numpy()), index=exog.index
+        )
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            coefficients=self.coefficients,
+            thresholds=self.thresholds,
+            predictors=np.array(self.predictors),
+        )
+
+
+def load_scorer(path: str) -> OrdinalScorer:
+    with np.load(path) as arrays:
+        return OrdinalScorer(
+            arrays["coefficients"],
+            arrays["thresholds"],
+            arrays["predictors"].tolist(),
+        )
+
+
+def export_scorer(
+    model, predictors: list, check_df: pd.DataFrame = None, atol: float = 1e-10
+) -> OrdinalScorer:
+    """
+    Extract the inference parameters of a fitted statsmodels OrderedModel with a
+    probit link into an OrdinalScorer.
+
+    Args:
+        model: The fitted OrderedModel results.
+        predictors (list): The columns the model was trained on, in training order.
+        check_df (pd.DataFrame): Rows both models are scored on to check the export,
+            standard normal predictor values when None.
+        atol (float): The largest allowed difference between their probabilities.
+
+    Raises:
+        ValueError: If the model does not use a normal distribution, or if the
+            probabilities of the exported scorer differ from the original model.
+
+    Returns:
+        OrdinalScorer: The exported scorer.
+    """
+    if model.model.distr.name != "norm":
+        raise ValueError(
+            f"Only probit ordinal models can be exported, not {model.model.distr.name}"
+        )
+    params = np.asarray(model.params, dtype=float)
+    k_vars = model.model.k_vars
+    scorer = OrdinalScorer(
+        params[:k_vars],
+        model.model.transform_threshold_params(params),
+        predictors,
+    )
+    if check_df is None:
+        rng = np.random.default_rng(0)
+        check_df = pd.DataFrame(
+            rng.standard_normal((1000, len(predictors))), columns=predictors
+        )
+    expected = np.asarray(model.predict(check_df[predictors]), dtype=float)
+    difference = np.abs(scorer.predict_proba(check_df[predictors]) - expected).max()
+    if difference > atol:
+        raise ValueError(
+            f"Exported scorer differs from the model by up to {difference}"
+        )
+    print(f"Exported scorer matches the model up to {difference:.2e}")
+    return scorer
@@ -1,51 +1,65 @@
 import pandas as pd
-import duckdb
-import pickle
 import os
 import time
+from model_registry import InferenceEngine, ModelRegistry
 
+INPUT_DIR = "datasets/predict/input"
+OUTPUT_DIR = "datasets/predict/output"
 
-def get_predictions(model, test_df: pd.DataFrame, trace_df: pd.DataFrame):
-    pred_df = model.predict(test_df[trace_df.predictors[0]])
-    pred_df["prediction"] = list(pred_df.idxmax(axis=1) + 1)
-    return pred_df
 
+def get_predictions(model, test_df: pd.DataFrame, predictors: list):
+    pred_df = model.predict(test_df[predictors])
+    # same as idxmax over the rows, without its per-row overhead
+    levels = pred_df.columns.to_numpy()
+    pred_df["prediction"] = levels[pred_df.to_numpy().argmax(axis=1)] + 1
+    return pred_df
 
-print("Loading model training data from tracing db for model reconstruction.")
-con = duckdb.connect("datasets/trace/data-governance.db")
-trace_df = con.execute("select * from model_training").df()
-print("Model training data loaded.")
-con.close()
 
-print("Loading model from pickle file.")
-model_path = "datasets/predict/model/model.pkl"
-with open(model_path, "rb") as f:
-    model = pickle.load(f)
-print("Model loaded.")
+def predict_latest_file(
+    model, predictors: list, input_dir: str = INPUT_DIR, output_dir: str = OUTPUT_DIR
+) -> None:
+    """
+    Run predictions on the most recently modified .csv file of the input directory
+    and save them to the output directory.
 
+    Args:
+        model: The fitted model.
+        predictors (list): The columns the model was trained on.
+        input_dir (str): The directory of the files to predict.
+        output_dir (str): The directory to save the predictions to.
+    """
+    files = os.listdir(input_dir)
+    csv_files = [f for f in files if f.endswith(".csv")]
 
-input_dir = "datasets/predict/input"
-files = os.listdir(input_dir)
-csv_files = [f for f in files if f.endswith(".csv")]
+    if not csv_files:
+        print("No .csv files found in the directory.")
+        return
 
-if csv_files:
     latest_file = max(
         csv_files, key=lambda f: os.path.getmtime(os.path.join(input_dir, f))
     )
     file_path = os.path.join(input_dir, latest_file)
     df = pd.read_csv(file_path)
-else:
-    print("No .csv files found in the directory.")
 
-print("Running predictions on {}.".format(file_path))
-pred_df = get_predictions(model, df, trace_df)
+    print("Running predictions on {}.".format(file_path))
+    pred_df = get_predictions(model, df, predictors)
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    timestamp_millis = str(int(time.time() * 1000))
+    output_filename = (
+        latest_file[:-4] + "_predictions_" + str(timestamp_millis) + ".csv"
+    )
+    output_path = os.path.join(output_dir, output_filename)
+    pred_df.to_csv(output_path, index=False)
+    print("Predictions saved to {}.".format(output_path))
 
-output_dir = "datasets/predict/output"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
 
-timestamp_millis = str(int(time.time() * 1000))
-output_filename = latest_file[:-4] + "_predictions_" + str(timestamp_millis) + ".csv"
-output_path = os.path.join(output_dir, output_filename)
-pred_df.to_csv(output_path, index=False)
-print("Predictions saved to {}.".format(file_path[:-4] + "_predictions.csv"))
+if __name__ == "__main__":
+    # the latest registered training run when None
+    run_id = None
+    inference_engine = InferenceEngine.SCORER
+    run_id, model, predictors = ModelRegistry().load(run_id, inference_engine)
+    print("Predicting with the model of run {}.".format(run_id))
+    predict_latest_file(model, predictors)
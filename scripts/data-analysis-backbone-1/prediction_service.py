@@ -0,0 +1,238 @@
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import queue
+import threading
+import time
+import numpy as np
+import pandas as pd
+from model_registry import InferenceEngine, ModelRegistry
+from prediction import get_predictions
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+class MicroBatcher:
+    """
+    Collects the rows of concurrent requests into batches that are scored with one
+    call of the model, on a single background thread that owns the model.
+
+    A batch is scored once it has max_batch_rows rows or its first request waited
+    max_wait_ms milliseconds, whichever comes first.
+    """
+
+    def __init__(
+        self, predict_batch, max_batch_rows: int = 4096, max_wait_ms: float = 5
+    ) -> None:
+        self.predict_batch = predict_batch
+        self.max_batch_rows: int = max_batch_rows
+        self.max_wait: float = max_wait_ms / 1000
+        self._requests: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, df: pd.DataFrame) -> Future:
+        """
+        Queue rows for scoring.
+
+        Returns:
+            Future: Resolves to the predictions of the rows, in the same order.
+        """
+        future = Future()
+        self._requests.put((df, future))
+        return future
+
+    def close(self) -> None:
+        self._requests.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> list:
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        rows = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # finish the current batch before stopping
+                self._requests.put(None)
+                break
+            batch.append(request)
+            rows += len(request[0])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                pred_df = self.predict_batch(
+                    pd.concat([df for df, _ in batch], ignore_index=True)
+                )
+            except Exception:
+                # rescore the requests one at a time, so only the failing ones fail
+                for df, future in batch:
+                    try:
+                        future.set_result(self.predict_batch(df).reset_index(drop=True))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            start = 0
+            for df, future in batch:
+                end = start + len(df)
+                future.set_result(pred_df.iloc[start:end].reset_index(drop=True))
+                start = end
+
+
+class PredictionService:
+    """
+    Keeps the model of a training run and its predictors loaded for the lifetime of
+    the process, so a request only pays for scoring its rows.
+    """
+
+    def __init__(
+        self,
+        run_id: str = None,
+        inference_engine: InferenceEngine = InferenceEngine.SCORER,
+        max_batch_rows: int = 4096,
+        max_wait_ms: float = 5,
+    ) -> None:
+        registry = ModelRegistry()
+        self.run_id, self.model, self.predictors = registry.load(
+            run_id, inference_engine
+        )
+        # the service runs for long, and must not keep the tracing database locked
+        registry.close()
+        self.batcher: MicroBatcher = MicroBatcher(
+            self.predict_batch, max_batch_rows, max_wait_ms
+        )
+
+    def predict_batch(self, df: pd.DataFrame) -> pd.DataFrame:
+        return get_predictions(self.model, df, self.predictors)
+
+    def predict(self, rows: list) -> pd.DataFrame:
+        """
+        Score rows given as dicts of column values.
+
+        The predictors are checked before the rows are batched with other requests,
+        so invalid rows only fail their own request.
+
+        Raises:
+            ValueError: If a predictor column is missing from the rows, or has
+                non-numeric, missing or infinite values.
+        """
+        df = pd.DataFrame.from_records(rows)
+        missing = [p for p in self.predictors if p not in df.columns]
+        if missing:
+            raise ValueError(f"Missing predictor columns: {missing}")
+        df = df[self.predictors].apply(pd.to_numeric, errors="raise")
+        invalid = ~np.isfinite(df.to_numpy(dtype=float)).all(axis=0)
+        if invalid.any():
+            raise ValueError(
+                f"Missing or infinite values in predictor columns: {list(df.columns[invalid])}"
+            )
+        return self.batcher.submit(df).result()
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # the default backlog of 5 resets connections under bursts of concurrent clients
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def create_handler(service: PredictionService):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:
+            if self.path != "/health":
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            self._send_json(
+                200,
+                {
+                    "status": "ok",
+                    "run_id": service.run_id,
+                    "predictors": service.predictors,
+                },
+            )
+
+        def do_POST(self) -> None:
+            if self.path != "/predict":
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                rows = json.loads(self.rfile.read(length))["rows"]
+                pred_df = service.predict(rows)
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(
+                200,
+                {
+                    "predictions": pred_df["prediction"].astype(int).tolist(),
+                    "probabilities": pred_df.drop(columns="prediction")
+                    .to_numpy()
+                    .tolist(),
+                },
+            )
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return PredictionHandler
+
+
+def serve(
+    host: str = HOST,
+    port: int = PORT,
+    run_id: str = None,
+    max_batch_rows: int = 4096,
+    max_wait_ms: float = 5,
+) -> None:
+    """
+    Serve predictions over HTTP until interrupted.
+
+    POST /predict with {"rows": [{column: value, ...}, ...]} returns the predicted
+    class and the class probabilities of every row; GET /health lists the predictors.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        run_id (str): The ID of the training run, the latest registered run when None.
+        max_batch_rows (int): Maximum number of rows scored with one model call.
+        max_wait_ms (float): How long a request waits for others to batch with.
+    """
+    service = PredictionService(
+        run_id, max_batch_rows=max_batch_rows, max_wait_ms=max_wait_ms
+    )
+    server = PredictionServer((host, port), create_handler(service))
+    print(f"Serving predictions of run {service.run_id} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.batcher.close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,128 +1,61 @@
 import pandas as pd
 import numpy as np
 import os
-from data_io.data_io import execute_query, write_data
+from concurrent.futures import ProcessPoolExecutor
+from data_io.data_io import execute_query
+from data_io.connections import transaction
+from location_matching import LocationIndex, MatchCache, location_version
 
+LOCATION_COLUMNS = ["neighborhood_name", "district_name", "section"]
 
-def jaccard_containment_similarity(x, y):
-    """
-    Calculate the Jaccard-Containment similarity between two sets.
-
-    The Jaccard-Containment similarity is a measure of the overlap between two sets.
-    It is calculated as the size of the intersection divided by the size of the union of the two sets,
-    plus a containment score which is 1 if one set is contained within the other, and 0 otherwise.
-    The final similarity score is the average of the Jaccard similarity and the containment score.
+# location data of the worker processes, set once per worker by init_worker
+worker_location_df = None
 
-    Parameters:
-    x (set): The first set.
-    y (set): The second set.
 
-    Returns:
-    float: The Jaccard-Containment similarity between x and y.
+def add_discard_flags(dfs, location_df):
     """
-    intersection_cardinality = len(set.intersection(*[set(x), set(y)]))
-    union_cardinality = len(set.union(*[set(x), set(y)]))
-    jaccard_similarity = intersection_cardinality / float(union_cardinality)
-
-    containment_score = 1 if x in y or y in x else 0
-
-    return 0.5 * jaccard_similarity + 0.5 * containment_score
+    Flag the rows whose most similar section, district, and neighborhood are not a location in a DataFrame.
 
-
-def find_most_similar_rows(main_df, reference_df, column_name, custom_similarity_func):
-    """
-    Find the most similar rows in a reference DataFrame for each row in the main DataFrame.
-
-    This function computes a similarity matrix between the 'time_and_space_obf' column of the main DataFrame
-    and a specified column of the reference DataFrame using a custom similarity function.
-    It then finds the index of the most similar row in the reference DataFrame for each row in the main DataFrame.
-    The most similar rows are added to the main DataFrame as a new column.
+    A location is considered a match if the section, district name, and neighborhood name all match. The flags of
+    all DataFrames are computed in one left join of their rows against the distinct locations, whose indicator column
+    tells which rows found no matching location.
 
     Parameters:
-    main_df (pandas.DataFrame): The main DataFrame.
-    reference_df (pandas.DataFrame): The reference DataFrame.
-    column_name (str): The name of the column in the reference DataFrame to compute similarities with.
-    custom_similarity_func (function): The custom function to compute similarities.
-                                        This function should take two arguments (two sets) and return a similarity score.
-
-    Returns:
-    None. The main_df is modified in-place to include a new column with the most similar rows from the reference DataFrame.
-    """
-    similarity_matrix = np.vectorize(custom_similarity_func)(
-        main_df["time_and_space_obf"].values[:, None], reference_df[column_name].values
-    )
-    most_similar_indices = np.argmax(similarity_matrix, axis=1)
-    most_similar_rows = reference_df.iloc[most_similar_indices]
-    main_df[f"most_similar_{column_name}"] = most_similar_rows[column_name].reset_index(
-        drop=True
-    )
-
-
-def is_matching_location(row, location_df):
-    """
-    Check if a row's most similar section, district, and neighborhood match with any location in a DataFrame.
-
-    This function checks if the 'most_similar_section', 'most_similar_district_name', and
-    'most_similar_neighborhood_name' values in a given row match with any location in the location DataFrame.
-    A location is considered a match if the section, district name, and neighborhood name all match.
-
-    Parameters:
-    row (pandas.Series): A row from a DataFrame.
-                         This row should contain 'most_similar_section', 'most_similar_district_name',
-                         and 'most_similar_neighborhood_name' columns.
+    dfs (list of pandas.DataFrame): DataFrames containing 'most_similar_section', 'most_similar_district_name',
+                                    and 'most_similar_neighborhood_name' columns.
     location_df (pandas.DataFrame): A DataFrame containing location data.
                                     This DataFrame should contain 'section', 'district_name',
                                     and 'neighborhood_name' columns.
 
     Returns:
-    bool: True if a matching location is found in location_df, False otherwise.
+    None. Every DataFrame is modified in-place to include a 'discard' column, which is True for rows without a
+    matching location.
     """
-    section_match = location_df["section"] == row["most_similar_section"]
-
-    if not location_df[section_match].empty:
-        district_match = (
-            location_df["district_name"].iloc[0] == row["most_similar_district_name"]
-        )
-        neighborhood_match = (
-            location_df["neighborhood_name"].iloc[0]
-            == row["most_similar_neighborhood_name"]
-        )
-        return district_match and neighborhood_match
-    else:
-        return False
-
-
-def mark_discard_flag(row, location_df):
-    """
-    Mark a row for discard if its most similar section, district, and neighborhood do not match with any location in a DataFrame.
-
-    This function uses the `is_matching_location` function to check if the 'most_similar_section',
-    'most_similar_district_name', and 'most_similar_neighborhood_name' values in a given row match with any location
-    in the location DataFrame. If a matching location is not found, the row is marked for discard.
-
-    Parameters:
-    row (pandas.Series): A row from a DataFrame.
-                         This row should contain 'most_similar_section', 'most_similar_district_name',
-                         and 'most_similar_neighborhood_name' columns.
-    location_df (pandas.DataFrame): A DataFrame containing location data.
-                                    This DataFrame should contain 'section', 'district_name',
-                                    and 'neighborhood_name' columns.
-
-    Returns:
-    bool: True if a matching location is not found in location_df (i.e., the row should be discarded), False otherwise.
-    """
-    return not is_matching_location(row, location_df)
+    keys = [
+        "most_similar_section",
+        "most_similar_district_name",
+        "most_similar_neighborhood_name",
+    ]
+    locations = location_df[["section", "district_name", "neighborhood_name"]]
+    locations = locations.drop_duplicates().set_axis(keys, axis=1)
+    rows = pd.concat([df[keys] for df in dfs], ignore_index=True)
+    merged = rows.merge(locations, on=keys, how="left", indicator=True)
+    discard = (merged["_merge"] == "left_only").to_numpy()
+    boundaries = np.cumsum([len(df) for df in dfs])[:-1]
+    for df, flags in zip(dfs, np.split(discard, boundaries)):
+        df["discard"] = flags
 
 
-def add_valid_year_flag(df):
+def add_valid_year_flag(df, year_df):
     """
     Add a flag to a DataFrame indicating whether each row's year is valid.
 
-    This function checks if the 'year' value in each row of the given DataFrame is present in the global `year_df` DataFrame.
+    This function checks if the 'year' value in each row of the given DataFrame is present in the `year_df` DataFrame.
     It adds a new column 'valid_year' to the DataFrame, which is True for rows with a valid year and False for rows with an invalid year.
 
     Parameters:
     df (pandas.DataFrame): A DataFrame containing a 'year' column.
+    year_df (pandas.DataFrame): A DataFrame containing the valid years in a 'year' column.
 
     Returns:
     pandas.DataFrame: The same DataFrame, but with an additional 'valid_year' column.
@@ -147,150 +80,233 @@ def remove_invalid_years(df):
     return df[df["valid_year"]].reset_index(drop=True)
 
 
-# load discovery data
-print("Loading discovery data...")
-data_discovery_root = "datasets/landing-zone/data-discovery"
+class DiscoverySource:
+    """
+    A discovery dataset whose obfuscated locations are resolved against the Location data.
 
-deaths_source_file = os.path.join(data_discovery_root, "deaths.csv")
-population_source_file = os.path.join(data_discovery_root, "population.csv")
-gini_source_file = os.path.join(data_discovery_root, "gini.csv")
+    Attributes:
+    name (str): The name of the dataset, also the name of its table in the trusted zone.
+    source_file (str): The path to the CSV file of the dataset.
+    columns (dict): The columns persisted to the trusted zone, mapped to their name there.
+                    Besides the columns of the CSV file, 'year' and the 'most_similar_<location column>' columns can be used.
+    """
 
-print("Loading deaths, population, and gini data...")
-deaths_df = pd.read_csv(deaths_source_file)
-population_df = pd.read_csv(population_source_file)
-gini_df = pd.read_csv(gini_source_file)
+    def __init__(self, name, source_file, columns):
+        self.name = name
+        self.source_file = source_file
+        self.columns = columns
+
+    def load(self):
+        """
+        Load the dataset and split its 'time_and_space_obf' column into the year and the obfuscated location.
+
+        Returns:
+        pandas.DataFrame: The dataset.
+        """
+        df = pd.read_csv(self.source_file)
+        df[["year", "time_and_space_obf"]] = df["time_and_space_obf"].str.extract(
+            r"(.{4})(.*)"
+        )
+        return df
 
-dfs = [deaths_df, population_df, gini_df]
 
+def init_worker(location_df):
+    global worker_location_df
+    worker_location_df = location_df
 
-# load exploitation data through which augmentation will be done
-print("Loading exploitation data...")
-path_to_exploitation_db = "datasets/exploitation-zone/exploitation.db"
 
-print("Loading Location data...")
-location_query = """
-select *
-from Location
-"""
-location_df = execute_query(location_query, path_to_exploitation_db)
-location_df["section"] = location_df["section"].astype(str)
+def match_chunk(location_column, queries):
+    """
+    Find the most similar value of a location column for a chunk of obfuscated strings, in a worker process.
+    """
+    values = worker_location_df[location_column].values
+    return list(values[LocationIndex(values).match(queries)])
+
+
+def resolve_locations(
+    dfs, location_df, match_cache=None, max_workers=None, chunk_size=2048
+):
+    """
+    Add the most similar value of every location column to every row of the DataFrames.
 
-print("Loading Year data...")
-year_query = """
-select distinct(year)
-from Income
-"""
-year_df = execute_query(year_query, path_to_exploitation_db)
+    The distinct obfuscated strings of all DataFrames are resolved once per location column. Strings that are not in
+    the match cache are scored in chunks on a process pool, each worker holding its own read-only copy of the location
+    data, and the new matches are stored in the cache in one batch per column.
 
+    Parameters:
+    dfs (list of pandas.DataFrame): DataFrames containing a 'time_and_space_obf' column.
+    location_df (pandas.DataFrame): A DataFrame containing the LOCATION_COLUMNS.
+    match_cache (MatchCache): Persistent cache of resolved matches.
+    max_workers (int): The number of worker processes, one per CPU when None.
+    chunk_size (int): The number of strings scored per task.
 
-# extract year from time_and_space_obf
-print("Extracting year from time_and_space_obf...")
-for df in dfs:
-    df[["year", "time_and_space_obf"]] = df["time_and_space_obf"].str.extract(
-        r"(.{4})(.*)"
+    Returns:
+    None. Every DataFrame is modified in-place to include a 'most_similar_<location column>' column per location column.
+    """
+    distinct_queries = np.unique(
+        np.concatenate([df["time_and_space_obf"].to_numpy(dtype=object) for df in dfs])
     )
+    matches = dict()
+    pending = dict()
+    for location_column in LOCATION_COLUMNS:
+        cached = dict()
+        if match_cache is not None:
+            version = location_version(location_df[location_column].values)
+            cached = match_cache.lookup(location_column, version)
+        matches[location_column] = cached
+        pending[location_column] = [q for q in distinct_queries if q not in cached]
+        print(
+            f"{len(distinct_queries) - len(pending[location_column])} out of {len(distinct_queries)} distinct strings matched to {location_column} from cache"
+        )
+
+    tasks = []
+    for location_column, queries in pending.items():
+        for start in range(0, len(queries), chunk_size):
+            end = start + chunk_size
+            tasks.append((location_column, queries[start:end]))
+    if tasks:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_worker, initargs=(location_df,)
+        ) as executor:
+            results = executor.map(match_chunk, *zip(*tasks))
+            for (location_column, queries), resolved in zip(tasks, results):
+                matches[location_column].update(zip(queries, resolved))
+
+    for location_column, queries in pending.items():
+        if match_cache is not None and queries:
+            version = location_version(location_df[location_column].values)
+            match_cache.store(
+                location_column,
+                version,
+                {q: matches[location_column][q] for q in queries},
+            )
+        for df in dfs:
+            df[f"most_similar_{location_column}"] = df["time_and_space_obf"].map(
+                matches[location_column]
+            )
+
+
+def persist_to_trusted(dfs_by_name, path_to_trusted):
+    """
+    Write DataFrames to the trusted zone in a single transaction, one table per DataFrame.
 
+    Parameters:
+    dfs_by_name (dict): Table name to the DataFrame to write.
+    path_to_trusted (str): The path to the trusted zone DuckDB database.
 
-# find most similar rows based on location data
-print("Finding most similar rows based on location data...")
-location_columns = ["neighborhood_name", "district_name", "section"]
-for df in dfs:
-    for loc in location_columns:
-        find_most_similar_rows(df, location_df, loc, jaccard_containment_similarity)
-
-
-# set discard flag for rows that do not match with any location
-print("Setting discard flag for rows that do not match with any location...")
-for df in dfs:
-    df["discard"] = df.apply(lambda row: mark_discard_flag(row, location_df), axis=1)
-
-print(
-    f"Percentage of rows to discard in deaths: {deaths_df[~deaths_df['discard']].shape[0]/len(deaths_df)}"
-)
-print(
-    f"Percentage of rows to discard in population: {population_df[~population_df['discard']].shape[0]/len(population_df)}"
-)
-print(
-    f"Percentage of rows to discard in gini: {gini_df[~gini_df['discard']].shape[0]/len(gini_df)}"
-)
-
-
-# set valid year flag
-print("Setting valid year flag...")
-for df in dfs:
-    df = add_valid_year_flag(df)
-
-print(
-    f"Percentage of rows with invalid year in deaths: {deaths_df[~deaths_df['valid_year']].shape[0]/len(deaths_df)}"
-)
-print(
-    f"Percentage of rows with invalid year in population: {population_df[~population_df['valid_year']].shape[0]/len(population_df)}"
-)
-print(
-    f"Percentage of rows with invalid year in gini: {gini_df[~gini_df['valid_year']].shape[0]/len(gini_df)}"
-)
-
-# Prep data for persisting
-print("Preparing data for persisting...")
-deaths_df = deaths_df[
-    [
-        "NACIONALITAT_PAIS",
-        "NACIONALITAT_CONTINENT",
-        "Valor",
-        "year",
-        "most_similar_neighborhood_name",
-        "most_similar_district_name",
-    ]
-]
-deaths_df = deaths_df.rename(
-    columns={
-        "NACIONALITAT_PAIS": "nationality_country",
-        "NACIONALITAT_CONTINENT": "nationality_continent",
-        "Valor": "value",
-        "most_similar_neighborhood_name": "neighborhood",
-        "most_similar_district_name": "district",
-    }
-)
-
-population_df = population_df[
-    [
-        "Valor",
-        "NACIONALITAT_G",
-        "SEXE",
-        "year",
-        "most_similar_neighborhood_name",
-        "most_similar_district_name",
-    ]
-]
-population_df = population_df.rename(
-    columns={
-        "NACIONALITAT_G": "nationality_continent",
-        "Valor": "value",
-        "SEXE": "gender",
-        "most_similar_neighborhood_name": "neighborhood",
-        "most_similar_district_name": "district",
+    Returns:
+    None.
+    """
+    with transaction(path_to_trusted) as con:
+        for table_name, df in dfs_by_name.items():
+            print(f"Writing {len(df)} rows to table {table_name}")
+            con.register("df", df)
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
+            con.unregister("df")
+
+
+def run_discovery(
+    sources,
+    path_to_exploitation_db,
+    path_to_trusted,
+    path_to_match_cache=None,
+    max_workers=None,
+):
+    """
+    Augment discovery datasets with the Location data of the exploitation zone and persist them to the trusted zone.
+
+    Parameters:
+    sources (list of DiscoverySource): The discovery datasets.
+    path_to_exploitation_db (str): The path to the exploitation zone DuckDB database.
+    path_to_trusted (str): The path to the trusted zone DuckDB database.
+    path_to_match_cache (str): The path to the DuckDB database caching resolved matches, no caching when None.
+    max_workers (int): The number of worker processes resolving locations, one per CPU when None.
+
+    Returns:
+    dict: Source name to the persisted DataFrame.
+    """
+    print("Loading discovery data...")
+    dfs = [source.load() for source in sources]
+
+    print("Loading Location data...")
+    location_df = execute_query("select * from Location", path_to_exploitation_db)
+    location_df["section"] = location_df["section"].astype(str)
+
+    print("Loading Year data...")
+    year_df = execute_query(
+        "select distinct(year) from Income", path_to_exploitation_db
+    )
+
+    print("Finding most similar rows based on location data...")
+    match_cache = MatchCache(path_to_match_cache) if path_to_match_cache else None
+    resolve_locations(dfs, location_df, match_cache, max_workers)
+
+    print("Setting discard flag for rows that do not match with any location...")
+    add_discard_flags(dfs, location_df)
+    for source, df in zip(sources, dfs):
+        print(
+            f"Percentage of rows to discard in {source.name}: {df[df['discard']].shape[0]/len(df)}"
+        )
+
+    print("Setting valid year flag...")
+    for source, df in zip(sources, dfs):
+        add_valid_year_flag(df, year_df)
+        print(
+            f"Percentage of rows with invalid year in {source.name}: {df[~df['valid_year']].shape[0]/len(df)}"
+        )
+
+    print("Preparing data for persisting...")
+    dfs_by_name = {
+        source.name: df[list(source.columns)].rename(columns=source.columns)
+        for source, df in zip(sources, dfs)
     }
-)
 
-gini_df = gini_df[
-    [
-        "Index_Gini",
-        "year",
-        "most_similar_neighborhood_name",
-        "most_similar_district_name",
+    print("Persisting data to trusted zone...")
+    persist_to_trusted(dfs_by_name, path_to_trusted)
+    return dfs_by_name
+
+
+if __name__ == "__main__":
+    data_discovery_root = "datasets/landing-zone/data-discovery"
+    discovery_sources = [
+        DiscoverySource(
+            "deaths",
+            os.path.join(data_discovery_root, "deaths.csv"),
+            {
+                "NACIONALITAT_PAIS": "nationality_country",
+                "NACIONALITAT_CONTINENT": "nationality_continent",
+                "Valor": "value",
+                "year": "year",
+                "most_similar_neighborhood_name": "neighborhood",
+                "most_similar_district_name": "district",
+            },
+        ),
+        DiscoverySource(
+            "population",
+            os.path.join(data_discovery_root, "population.csv"),
+            {
+                "Valor": "value",
+                "NACIONALITAT_G": "nationality_continent",
+                "SEXE": "gender",
+                "year": "year",
+                "most_similar_neighborhood_name": "neighborhood",
+                "most_similar_district_name": "district",
+            },
+        ),
+        DiscoverySource(
+            "gini",
+            os.path.join(data_discovery_root, "gini.csv"),
+            {
+                "Index_Gini": "gini_index",
+                "year": "year",
+                "most_similar_neighborhood_name": "neighborhood",
+                "most_similar_district_name": "district",
+            },
+        ),
     ]
-]
-gini_df = gini_df.rename(
-    columns={
-        "Index_Gini": "gini_index",
-        "most_similar_neighborhood_name": "neighborhood",
-        "most_similar_district_name": "district",
-    }
-)
-
-# Persisting data to trusted zone
-print("Persisting data to trusted zone...")
-path_to_trusted = "datasets/trusted-zone/trusted.db"
-write_data(deaths_df, path_to_trusted, "deaths")
-write_data(population_df, path_to_trusted, "population")
-write_data(gini_df, path_to_trusted, "gini")
+    run_discovery(
+        discovery_sources,
+        path_to_exploitation_db="datasets/exploitation-zone/exploitation.db",
+        path_to_trusted="datasets/trusted-zone/trusted.db",
+        path_to_match_cache="datasets/trusted-zone/match_cache.db",
+    )
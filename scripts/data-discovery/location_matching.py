@@ -0,0 +1,113 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from data_io.connections import cursor, transaction
+from set_similarity import SetSimilarityIndex
+
+MATCH_CACHE_TABLE_NAME = "location_match_cache"
+
+
+class LocationIndex:
+    """
+    Index over the values of a reference column for finding, for a query string,
+    the first reference row with the highest Jaccard-Containment similarity.
+
+    The reference values are encoded once into a SetSimilarityIndex and every
+    distinct query string is scored once, in blocks of matrix operations.
+    The result is the row np.argmax over the full similarity matrix would pick.
+    """
+
+    def __init__(self, values) -> None:
+        self.similarity_index: SetSimilarityIndex = SetSimilarityIndex(values)
+
+    def match(self, queries) -> np.ndarray:
+        """
+        Find the position of the most similar reference value for every string.
+        """
+        distinct_queries, inverse = np.unique(
+            np.asarray(queries, dtype=object), return_inverse=True
+        )
+        positions, _ = self.similarity_index.top_k(distinct_queries, k=1)
+        return positions[:, 0][inverse]
+
+
+def location_version(values) -> str:
+    """
+    Fingerprint the values of a location column, in order, as ties between equally
+    similar values are broken by their position.
+
+    Args:
+        values (list): The values of the location column.
+
+    Returns:
+        str: The SHA-256 hex digest of the values.
+    """
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(str(value).encode())
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class MatchCache:
+    """
+    Persistent cache of resolved location matches in a DuckDB database, keyed by
+    location column, location column version and the obfuscated string.
+    """
+
+    def __init__(self, path_to_db: str) -> None:
+        self.path_to_db: str = path_to_db
+        dir_of_db = os.path.dirname(path_to_db)
+        if dir_of_db and not os.path.exists(dir_of_db):
+            print(f"Creating folder: {dir_of_db}")
+            os.makedirs(dir_of_db)
+        with cursor(path_to_db) as con:
+            con.execute(f"""
+                CREATE TABLE IF NOT EXISTS {MATCH_CACHE_TABLE_NAME}(
+                  location_column VARCHAR,
+                  location_version VARCHAR,
+                  query VARCHAR,
+                  match VARCHAR,
+                  PRIMARY KEY (location_column, location_version, query)
+                );
+                """)
+
+    def lookup(self, location_column: str, version: str) -> dict:
+        """
+        Load the resolved matches of a version of a location column.
+
+        Returns:
+            dict: Obfuscated string to its matched location value.
+        """
+        with cursor(self.path_to_db) as con:
+            rows = con.execute(
+                f"SELECT query, match FROM {MATCH_CACHE_TABLE_NAME} "
+                "WHERE location_column = ? AND location_version = ?",
+                [location_column, version],
+            ).fetchall()
+        return dict(rows)
+
+    def store(self, location_column: str, version: str, matches: dict) -> None:
+        """
+        Save newly resolved matches of a version of a location column.
+
+        Args:
+            location_column (str): The name of the location column.
+            version (str): The version of the location column.
+            matches (dict): Obfuscated string to its matched location value.
+        """
+        matches_df = pd.DataFrame(
+            {
+                "location_column": location_column,
+                "location_version": version,
+                "query": list(matches),
+                "match": [str(match) for match in matches.values()],
+            }
+        )
+        with transaction(self.path_to_db) as con:
+            con.register("matches_df", matches_df)
+            con.execute(
+                f"INSERT INTO {MATCH_CACHE_TABLE_NAME} SELECT * FROM matches_df"
+            )
+            con.unregister("matches_df")
@@ -0,0 +1,120 @@
+import numpy as np
+from scipy import sparse
+
+
+class CharacterSetEncoder:
+    """
+    Encoder of strings into sparse binary matrices, one row per string and one
+    column per character of the alphabet the encoder was built on.
+    """
+
+    def __init__(self, strings) -> None:
+        alphabet = sorted(set().union(*map(set, strings)))
+        self.columns: dict = {character: i for i, character in enumerate(alphabet)}
+
+    def transform(self, strings) -> tuple:
+        """
+        Encode strings into their character sets.
+
+        Args:
+            strings (list): The strings to encode.
+
+        Returns:
+            tuple: The sparse (strings x alphabet) matrix and the size of every
+                character set, which also counts characters outside the alphabet.
+        """
+        indptr, indices, sizes = [0], [], []
+        for string in strings:
+            charset = set(string)
+            indices.extend(self.columns[c] for c in charset if c in self.columns)
+            indptr.append(len(indices))
+            sizes.append(len(charset))
+        data = np.ones(len(indices), dtype=np.int64)
+        matrix = sparse.csr_matrix(
+            (data, indices, indptr), shape=(len(sizes), len(self.columns))
+        )
+        return matrix, np.array(sizes, dtype=np.int64)
+
+
+class SetSimilarityIndex:
+    """
+    Reference strings encoded once, for computing the Jaccard-Containment
+    similarity of blocks of query strings against all of them with matrix products.
+
+    The similarity of two strings is 0.5 * the Jaccard similarity of their
+    character sets plus 0.5 if one string contains the other. The character set
+    intersections of a whole block come from one sparse matrix product; the
+    substring test only runs for pairs where one character set is a subset of
+    the other, as no other pair can be in a containment relation.
+    """
+
+    def __init__(self, references) -> None:
+        # repeated references score the same, so only the first occurrence of every
+        # value is scored, the distinct values kept in order of first occurrence
+        _, first_positions = np.unique(
+            np.asarray(references, dtype=object), return_index=True
+        )
+        self.positions: np.ndarray = np.sort(first_positions)
+        self.references: np.ndarray = np.asarray(references, dtype=object)[
+            self.positions
+        ]
+        self.encoder: CharacterSetEncoder = CharacterSetEncoder(self.references)
+        self.matrix, self.sizes = self.encoder.transform(self.references)
+        self.matrix_t: sparse.csc_matrix = self.matrix.T.tocsc()
+
+    def scores(self, queries) -> np.ndarray:
+        """
+        Compute the similarity of every query string to every distinct reference string.
+
+        Args:
+            queries (list): The query strings.
+
+        Returns:
+            np.ndarray: The (queries x distinct references) similarity matrix.
+        """
+        queries = np.asarray(queries, dtype=object)
+        matrix, sizes = self.encoder.transform(queries)
+        intersection = (matrix @ self.matrix_t).toarray()
+        union = sizes[:, None] + self.sizes[None, :] - intersection
+        jaccard = intersection / union
+
+        rows, columns = np.nonzero(
+            (intersection == self.sizes[None, :]) | (intersection == sizes[:, None])
+        )
+        contained = np.fromiter(
+            (x in y or y in x for x, y in zip(queries[rows], self.references[columns])),
+            dtype=bool,
+            count=len(rows),
+        )
+        containment = np.zeros(intersection.shape, dtype=np.int64)
+        containment[rows[contained], columns[contained]] = 1
+        return 0.5 * jaccard + 0.5 * containment
+
+    def top_k(self, queries, k: int = 1, block_size: int = 2048) -> tuple:
+        """
+        Find the k most similar distinct reference strings of every query string,
+        ties broken by the position of the reference, in blocks of query strings.
+
+        Args:
+            queries (list): The query strings.
+            k (int): The number of matches per query.
+            block_size (int): The number of query strings scored at once.
+
+        Returns:
+            tuple: The (queries x k) positions of the matches among the references
+                the index was built on, and their similarities.
+        """
+        queries = np.asarray(queries, dtype=object)
+        k = min(k, len(self.references))
+        positions = np.empty((len(queries), k), dtype=np.int64)
+        similarities = np.empty((len(queries), k), dtype=np.float64)
+        for start in range(0, len(queries), block_size):
+            end = start + block_size
+            scores = self.scores(queries[start:end])
+            if k == 1:
+                top = np.argmax(scores, axis=1)[:, None]
+            else:
+                top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+            positions[start:end] = self.positions[top]
+            similarities[start:end] = np.take_along_axis(scores, top, axis=1)
+        return positions, similarities
@@ -0,0 +1,115 @@
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+import duckdb
+
+
+class ConnectionManager:
+    """
+    Cache of DuckDB connections, one per database file, shared for the whole run.
+
+    A DuckDB connection must not be used from several threads at once, so callers
+    work on cursors: each cursor is a separate connection to the same database
+    instance and is safe to use from the thread that created it.
+    """
+
+    def __init__(self) -> None:
+        self._connections: dict = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path_to_db: str) -> str:
+        return os.path.abspath(path_to_db)
+
+    def get(self, path_to_db: str) -> duckdb.DuckDBPyConnection:
+        """
+        Get the cached connection to a database, opening it on first use.
+
+        Args:
+            path_to_db (str): The path to the DuckDB database.
+
+        Returns:
+            duckdb.DuckDBPyConnection: The shared connection.
+        """
+        key = self._key(path_to_db)
+        with self._lock:
+            con = self._connections.get(key)
+            if con is None:
+                con = duckdb.connect(path_to_db)
+                self._connections[key] = con
+            return con
+
+    @contextmanager
+    def cursor(self, path_to_db: str):
+        """
+        Context manager yielding a new cursor on the cached connection to a database.
+
+        Args:
+            path_to_db (str): The path to the DuckDB database.
+        """
+        cursor = self.get(path_to_db).cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def transaction(self, path_to_db: str):
+        """
+        Context manager yielding a cursor inside a transaction, which is committed
+        when the block succeeds and rolled back when it raises.
+
+        Args:
+            path_to_db (str): The path to the DuckDB database.
+        """
+        with self.cursor(path_to_db) as cursor:
+            cursor.begin()
+            try:
+                yield cursor
+            except BaseException:
+                cursor.rollback()
+                raise
+            cursor.commit()
+
+    def close(self, path_to_db: str) -> None:
+        """
+        Close the cached connection to a database, if there is one.
+
+        Args:
+            path_to_db (str): The path to the DuckDB database.
+        """
+        with self._lock:
+            con = self._connections.pop(self._key(path_to_db), None)
+        if con is not None:
+            con.close()
+
+    def close_all(self) -> None:
+        """
+        Close every cached connection.
+        """
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for con in connections:
+            con.close()
+
+
+connection_manager = ConnectionManager()
+atexit.register(connection_manager.close_all)
+
+
+def get_connection(path_to_db: str) -> duckdb.DuckDBPyConnection:
+    return connection_manager.get(path_to_db)
+
+
+def cursor(path_to_db: str):
+    return connection_manager.cursor(path_to_db)
+
+
+def transaction(path_to_db: str):
+    return connection_manager.transaction(path_to_db)
+
+
+def close_connection(path_to_db: str) -> None:
+    connection_manager.close(path_to_db)
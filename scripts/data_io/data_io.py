@@ -1,6 +1,36 @@
 import duckdb
 import pandas as pd
+import pyarrow as pa
 import os
+import hashlib
+from data_io.connections import cursor, transaction
+
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def attach_database(con, path_to_db: str, alias: str, read_only: bool = True) -> None:
+    """
+    Attach a DuckDB database to a connection under an alias, unless it already is.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to attach the database to.
+        path_to_db (str): The path to the DuckDB database to attach.
+        alias (str): The name the database is attached as.
+        read_only (bool): Attach the database in read only mode.
+    """
+    attached = con.execute(
+        "select 1 from duckdb_databases() where database_name = ?", [alias]
+    ).fetchall()
+    if attached:
+        return
+    mode = " (READ_ONLY)" if read_only else ""
+    con.execute(f"ATTACH {quote_literal(path_to_db)} AS {quote(alias)}{mode}")
 
 
 def table_exists(con, table_name: str) -> bool:
@@ -21,34 +51,58 @@ def table_exists(con, table_name: str) -> bool:
         return False
 
 
-def load_data(path_to_db: str, table_name: str) -> pd.DataFrame:
+def file_sha256(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 hex digest of a file, reading it in chunks.
+
+    Args:
+        file_path (str): The file to hash.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_data(
+    path_to_db: str, table_name: str, as_arrow: bool = False
+) -> pd.DataFrame | pa.Table:
     """
     Load a table from a DuckDB database.
 
     Args:
         path_to_db (str): The path to the DuckDB database.
         table_name (str): The name of the table to load.
+        as_arrow (bool): Return DuckDB's Arrow result as is instead of
+            converting it to a pandas DataFrame.
 
     Returns:
-        pd.DataFrame: The loaded table.
+        pd.DataFrame | pa.Table: The loaded table.
     """
-    con = duckdb.connect(path_to_db)
-    if table_exists(con, table_name):
-        df = con.sql(f"select * from {table_name}").df()
-    else:
-        df = pd.DataFrame()
-    con.close()
-    return df
+    with cursor(path_to_db) as con:
+        if not table_exists(con, table_name):
+            return pa.table({}) if as_arrow else pd.DataFrame()
+        relation = con.sql(f"select * from {table_name}")
+        return relation.arrow() if as_arrow else relation.df()
 
 
-def write_data(df: pd.DataFrame, path_to_db: str, table_name: str) -> None:
+def write_data(
+    df: pd.DataFrame | pa.Table, path_to_db: str, table_name: str, replace: bool = False
+) -> None:
     """
     Save a table to a DuckDB database.
 
     Args:
-        df (pd.DataFrame): The table to save.
+        df (pd.DataFrame | pa.Table): The table to save.
         path_to_db (str): The path to the DuckDB database.
         table_name (str): The name of the table to save.
+        replace (bool): Whether to recreate an existing table with the columns of df,
+            instead of inserting df positionally into its existing columns.
     """
     dir_of_db = os.path.dirname(path_to_db)
     if not os.path.exists(dir_of_db):
@@ -57,26 +111,27 @@ def write_data(df: pd.DataFrame, path_to_db: str, table_name: str) -> None:
 
     if not os.path.exists(path_to_db):
         print(f"Creating db file: {path_to_db}")
-        con = duckdb.connect(path_to_db)
-        con.close()  # this should create the file
-
-    con = duckdb.connect(path_to_db)
-    con.register("df", df)
-    if table_exists(con, table_name):
-        print(f"Overwriting dataset in table {table_name}")
-        con.execute(f"DELETE FROM {table_name}")
-        con.execute(f"INSERT INTO {table_name} SELECT * FROM df")
-    else:
-        print(
-            f"Table {table_name} does not exist, creating from df with {len(df)} rows..."
-        )
-        con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM df")
-    con.close()
+
+    with transaction(path_to_db) as con:
+        con.register("df", df)
+        if replace:
+            print(f"Replacing table {table_name} with {len(df)} rows")
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
+        elif table_exists(con, table_name):
+            print(f"Overwriting dataset in table {table_name}")
+            con.execute(f"DELETE FROM {table_name}")
+            con.execute(f"INSERT INTO {table_name} SELECT * FROM df")
+        else:
+            print(
+                f"Table {table_name} does not exist, creating from df with {len(df)} rows..."
+            )
+            con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM df")
+        con.unregister("df")
 
 
 def copy_to_zone(
     datasets_root: str,
-    df: pd.DataFrame,
+    df: pd.DataFrame | pa.Table,
     create_table_statement: str,
     table_name: str,
     target_zone: str,
@@ -86,7 +141,7 @@ def copy_to_zone(
 
     Args:
         datasets_root (str): The root directory of the datasets.
-        df (pd.DataFrame): the dataset to save
+        df (pd.DataFrame | pa.Table): the dataset to save
         create_table_statement (str): the statement used ot create the table upon first run
         table_name (str): the name of the table to save
 
@@ -102,26 +157,40 @@ def copy_to_zone(
     db_file_path = os.path.join(target_dir, target_zone.split("-")[0] + ".db")
     if not os.path.exists(db_file_path):
         print(f"Creating db file for {target_zone}")
-        con = duckdb.connect(db_file_path)
-        con.close()  # this should create the file
-
-    con = duckdb.connect(db_file_path)
-    con.register("df", df)
-    if not table_exists(con, table_name):
-        print(f"Table {table_name} does not exist, creating...")
-        con.execute(create_table_statement)
-        print("Table created; Inserting rows...")
-        con.execute(f"INSERT INTO {table_name} SELECT * FROM df")
-        print(f"Inserted df rows to {table_name} table")
-    else:
-        print(f"Overwriting data in {table_name} table")
-        con.execute(f"DELETE FROM {table_name}")
-        con.execute(f"INSERT INTO {table_name} SELECT * FROM df")
-    con.close()
+
+    with transaction(db_file_path) as con:
+        con.register("df", df)
+        if not table_exists(con, table_name):
+            print(f"Table {table_name} does not exist, creating...")
+            con.execute(create_table_statement)
+            print("Table created; Inserting rows...")
+            con.execute(f"INSERT INTO {table_name} SELECT * FROM df")
+            print(f"Inserted df rows to {table_name} table")
+        else:
+            print(f"Overwriting data in {table_name} table")
+            con.execute(f"DELETE FROM {table_name}")
+            con.execute(f"INSERT INTO {table_name} SELECT * FROM df")
+        con.unregister("df")
 
 
 def execute_query(sql_query: str, path_to_exploitation_db: str) -> pd.DataFrame:
-    con = duckdb.connect(path_to_exploitation_db)
-    df = con.sql(sql_query).df()
-    con.close()
-    return df
+    with cursor(path_to_exploitation_db) as con:
+        return con.sql(sql_query).df()
+
+
+def fetch_record_batches(sql_query: str, path_to_db: str, batch_size: int = 100_000):
+    """
+    Run a query on a DuckDB database and stream its result as Arrow record batches.
+
+    Args:
+        sql_query (str): The query to run.
+        path_to_db (str): The path to the DuckDB database.
+        batch_size (int): Maximum number of rows per batch.
+
+    Yields:
+        pa.RecordBatch: The next batch of the result.
+    """
+    with cursor(path_to_db) as con:
+        reader = con.execute(sql_query).fetch_record_batch(batch_size)
+        for batch in reader:
+            yield batch
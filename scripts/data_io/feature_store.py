@@ -0,0 +1,71 @@
+import json
+import os
+import numpy as np
+from data_io.connections import cursor
+
+FEATURE_STORE_DIR = "datasets/feature-store-zone"
+FEATURE_STORE_DB_PATH = os.path.join(FEATURE_STORE_DIR, "feature-store.db")
+FEATURE_VERSIONS_TABLE_NAME = "feature_versions"
+SPLITS = ["train", "test", "valid"]
+
+
+def feature_array_dir(feature_set: str, version: int, root: str = FEATURE_STORE_DIR):
+    return os.path.join(root, feature_set, f"v{version}")
+
+
+def latest_feature_version(
+    feature_set: str, path_to_db: str = FEATURE_STORE_DB_PATH
+) -> int:
+    """
+    Get the latest materialized version of a feature set.
+
+    Raises:
+        ValueError: If the feature set was never materialized.
+    """
+    with cursor(path_to_db) as con:
+        version = con.execute(
+            f"SELECT max(version) FROM {FEATURE_VERSIONS_TABLE_NAME} WHERE feature_set = ?",
+            [feature_set],
+        ).fetchone()[0]
+    if version is None:
+        raise ValueError(f"Feature set {feature_set} is not materialized")
+    return version
+
+
+def load_feature_arrays(
+    feature_set: str,
+    version: int = None,
+    split: str = None,
+    root: str = FEATURE_STORE_DIR,
+) -> dict:
+    """
+    Load the arrays of a version of a feature set, memory-mapped from their .npy files,
+    so only the pages that are used are read from disk.
+
+    Args:
+        feature_set (str): The name of the feature set.
+        version (int): The version of the feature set, the latest one when None.
+        split (str): One of SPLITS to keep only its rows, all rows when None.
+        root (str): The directory of the feature store zone.
+
+    Returns:
+        dict: The array name to the array, with the predictor column names under
+            "predictors". Without a split the arrays are read-only memory maps,
+            with a split they are copies of the rows of the split.
+    """
+    if version is None:
+        version = latest_feature_version(
+            feature_set, os.path.join(root, os.path.basename(FEATURE_STORE_DB_PATH))
+        )
+    array_dir = feature_array_dir(feature_set, version, root)
+    with open(os.path.join(array_dir, "columns.json")) as f:
+        columns = json.load(f)
+    arrays = {
+        name: np.load(os.path.join(array_dir, f"{name}.npy"), mmap_mode="r")
+        for name in columns["arrays"]
+    }
+    if split is not None:
+        rows = arrays["split"] == SPLITS.index(split)
+        arrays = {name: array[rows] for name, array in arrays.items()}
+    arrays["predictors"] = columns["predictors"]
+    return arrays
@@ -1,6 +1,6 @@
 create_income_type_table_statement = """
     CREATE TABLE IncomeType(
-      id VARCHAR PRIMARY KEY,
+      id INT PRIMARY KEY,
       type VARCHAR
     );
 """
@@ -29,7 +29,7 @@ create_gender_table_statement = """
 
 create_income_table_statement = """
     CREATE TABLE Income(
-      income_type_id VARCHAR,
+      income_type_id INT,
       year INT,
       section INT,
       value FLOAT,
@@ -1,28 +1,2 @@
-import os
-import uuid
-
-
-def remove_file(file_path: str):
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        print(f"The file '{file_path}' has been removed.")
-    else:
-        print(f"The file '{file_path}' does not exist.")
-
-
-def generate_ids_dict(values: set) -> dict:
-    return {val: str(uuid.uuid1(0, 0)) for val in values}
-
-
 def generate_ids_tuples(ids_dict: dict) -> list:
     return [(ids_dict[key], key) for key in ids_dict.keys()]
-
-
-def normalize_section(row):
-    section = row["Secciones"]
-    return int(str(section).split()[3])
-
-
-def normalize_year(row):
-    date = row["Data_Referencia"]
-    return int(str(date).split("-")[0])
@@ -0,0 +1,106 @@
+from concurrent.futures import ProcessPoolExecutor
+import time
+import numpy as np
+import pandas as pd
+from fancyimpute import IterativeImputer
+
+
+def impute_partition(
+    values: np.ndarray,
+    sample_size: int = None,
+    random_state: int = 0,
+) -> tuple:
+    """
+    Impute the missing values of the rows of one partition based on MICE.
+
+    Only the columns with missing values are imputed; the complete ones are used as
+    predictors. When a sample size is given and the partition is larger, the imputer
+    is fitted on a random sample of that size and imputes every row with the fitted
+    models, which bounds the cost of the fit regardless of the partition size.
+
+    Args:
+        values (np.ndarray): The numerical columns of the rows of the partition.
+        sample_size (int): Maximum number of rows the imputer is fitted on.
+        random_state (int): Seed of the sample and of the imputer.
+
+    Returns:
+        tuple: The imputed values and the seconds the imputation took.
+    """
+    start = time.perf_counter()
+    imputer = IterativeImputer(
+        skip_complete=True, keep_empty_features=True, random_state=random_state
+    )
+    if sample_size is not None and len(values) > sample_size:
+        rng = np.random.default_rng(random_state)
+        imputer.fit(values[rng.choice(len(values), size=sample_size, replace=False)])
+        imputed = imputer.transform(values)
+    else:
+        imputed = imputer.fit_transform(values)
+    return imputed, time.perf_counter() - start
+
+
+def impute_partitioned(
+    df: pd.DataFrame,
+    partition_column: str = None,
+    sample_size: int = None,
+    max_workers: int = None,
+    random_state: int = 0,
+) -> pd.DataFrame:
+    """
+    Impute the missing values of the numerical columns of a dataframe in place based
+    on MICE, fitting one imputer per value of the partition column in parallel worker
+    processes, and print how long every partition took.
+
+    Partitions without missing values are skipped. A column missing in a whole
+    partition cannot be predicted there, so it is filled with the mean of the column
+    over the whole dataframe first.
+
+    Args:
+        df (pd.DataFrame): The dataframe to impute.
+        partition_column (str): The column a separate imputer is fitted per value of,
+            the whole dataframe is one partition when None.
+        sample_size (int): Maximum number of rows each imputer is fitted on.
+        max_workers (int): Number of worker processes, one per CPU when None.
+        random_state (int): Seed of the samples and of the imputers.
+
+    Returns:
+        pd.DataFrame: The imputed dataframe.
+    """
+    numerical_columns = df.select_dtypes(include=[np.number]).columns
+    missing_columns = numerical_columns[df[numerical_columns].isnull().any()]
+    if len(missing_columns) == 0:
+        print("No columns with missing values found.")
+        return df
+
+    if partition_column is None:
+        groups = {None: df.index}
+    else:
+        groups = df.groupby(partition_column, dropna=False).groups
+    partitions = []
+    for key, indices in groups.items():
+        values = df.loc[indices, numerical_columns].to_numpy(dtype=float)
+        missing = np.isnan(values)
+        if not missing.any():
+            continue
+        empty = missing.all(axis=0)
+        values[:, empty] = df[numerical_columns].mean().to_numpy()[empty]
+        partitions.append((key, indices, values))
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            impute_partition,
+            [values for _, _, values in partitions],
+            [sample_size] * len(partitions),
+            [random_state] * len(partitions),
+        )
+        positions = [numerical_columns.get_loc(column) for column in missing_columns]
+        for (key, indices, values), (imputed, seconds) in zip(partitions, results):
+            df.loc[indices, missing_columns] = imputed[:, positions]
+            print(
+                f"Imputed partition {partition_column}={key} with {len(values)} rows in {seconds:.2f}s"
+            )
+    print(
+        f"Imputed {len(partitions)} partitions of {len(df)} rows in {time.perf_counter() - start:.2f}s"
+    )
+    return df
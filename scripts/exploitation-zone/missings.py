@@ -1,11 +1,14 @@
+from functools import partial, reduce
 import pandas as pd
-import numpy as np
-from fancyimpute import IterativeImputer
+import pyarrow as pa
+import pyarrow.compute as pc
 from data_io.data_io import load_data, write_data
-
+from imputation import impute_partitioned
 
 PREPARED_EDUCATION_TABLE_NAME = "education_prepared"
 PREPARED_INCOME_TABLE_NAME = "income_prepared"
+# the reference date of the yearly education snapshots
+EDUCATION_PARTITION_COLUMN = "Data_Referencia"
 
 
 def handle_missings(
@@ -14,68 +17,94 @@ def handle_missings(
     source_table_name: str,
     target_table_name: str,
     handling_function,
+    as_arrow: bool = False,
 ) -> None:
     """
     Load a table from a DuckDB database, perform a function on it and write to the table in the database.
+    The target table is recreated, so it follows the columns of the source table when they change.
 
     Args:
         source_db_path (str): The source path to the DuckDB database.
         target_db_path (str): The target path to the DuckDB database.
         source_table_name (str): The name of the source table to load the data from.
         target_table_name (str): The name of the target table to write the data to.
-        handling_function: The function to perform on the table.
+        handling_function: The function to perform on the table, returning the handled table.
+        as_arrow (bool): Pass the table to the function as the pyarrow.Table DuckDB returns,
+            without converting it to pandas and back.
     """
-    df = load_data(source_db_path, source_table_name)
-    print(df.isnull().sum())
-    handling_function(df)
-    write_data(df, target_db_path, target_table_name)
+    df = load_data(source_db_path, source_table_name, as_arrow=as_arrow)
+    if as_arrow:
+        print(
+            {
+                name: column.null_count
+                for name, column in zip(df.column_names, df.columns)
+            }
+        )
+    else:
+        print(df.isnull().sum())
+    df = handling_function(df)
+    write_data(df, target_db_path, target_table_name, replace=True)
 
 
-def impute_missings(df: pd.DataFrame) -> pd.DataFrame:
+def impute_missings(
+    df: pd.DataFrame,
+    partition_column: str = None,
+    sample_size: int = None,
+    max_workers: int = None,
+) -> pd.DataFrame:
     """
     Impute missing values in a dataframe based on MICE.
 
     Args:
         df (pd.DataFrame): The dataframe to impute.
+        partition_column (str): The column a separate imputer is fitted per value of,
+            the whole dataframe is imputed at once when None.
+        sample_size (int): Maximum number of rows each imputer is fitted on.
+        max_workers (int): Number of worker processes, one per CPU when None.
     """
-    numerical_columns = df.select_dtypes(include=[np.number]).columns
-    columns_with_missing = df.columns[df.isnull().any()].tolist()
-    if len(columns_with_missing) == 0:
-        print("No columns with missing values found.")
-        return df
-    imputer = IterativeImputer()
-    df[numerical_columns] = imputer.fit_transform(df[numerical_columns])
-    return df
+    return impute_partitioned(df, partition_column, sample_size, max_workers)
 
 
-def remove_missings(df: pd.DataFrame) -> pd.DataFrame:
+def remove_missings(df: pd.DataFrame | pa.Table) -> pd.DataFrame | pa.Table:
     """
-    Remove rows with missing values from a dataframe.
+    Remove rows with missing values from a dataframe or an Arrow table, where NaN
+    values count as missing like in pandas.
 
     Args:
-        df (pd.DataFrame): The dataframe to remove rows from.
+        df (pd.DataFrame | pa.Table): The dataframe to remove rows from.
     """
+    if isinstance(df, pa.Table):
+        missing = reduce(
+            pc.or_, [pc.is_null(column, nan_is_null=True) for column in df.columns]
+        )
+        return df.filter(pc.invert(missing))
     df.dropna(inplace=True)
     return df
 
 
-def run_handle_missings():
+def run_handle_missings(source_tables: list = None):
     """
     Run the handle_missings function on the education and income tables.
+
+    Args:
+        source_tables (list): The trusted zone tables to prepare, all of them by default.
     """
     trusted_db_path = "datasets/trusted-zone/trusted.db"
     exploitation_db_path = "datasets/exploitation-zone/exploitation.db"
-    handle_missings(
-        trusted_db_path,
-        exploitation_db_path,
-        "education",
-        PREPARED_EDUCATION_TABLE_NAME,
-        impute_missings,
-    )
-    handle_missings(
-        trusted_db_path,
-        exploitation_db_path,
-        "income",
-        PREPARED_INCOME_TABLE_NAME,
-        remove_missings,
-    )
+    if source_tables is None or "education" in source_tables:
+        handle_missings(
+            trusted_db_path,
+            exploitation_db_path,
+            "education",
+            PREPARED_EDUCATION_TABLE_NAME,
+            partial(impute_missings, partition_column=EDUCATION_PARTITION_COLUMN),
+        )
+    if source_tables is None or "income" in source_tables:
+        handle_missings(
+            trusted_db_path,
+            exploitation_db_path,
+            "income",
+            PREPARED_INCOME_TABLE_NAME,
+            remove_missings,
+            as_arrow=True,
+        )
@@ -0,0 +1,62 @@
+# Queries selecting the rows of the star schema tables from the prepared tables of
+# exploitation.db, with trusted.db attached as trusted and the income type translations
+# loaded into a temporary income_type_translations(spanish, english) table.
+# The integer keys of the income types are taken from the surrogate key map.
+# The columns have the names and types of the tables they fill.
+
+select_income_types_statement = """
+    SELECT DISTINCT t.english AS natural_key
+    FROM income_prepared i
+    LEFT JOIN income_type_translations t
+      ON i."Indicadores de renta media y mediana" = t.spanish
+"""
+
+select_income_type_table_statement = f"""
+    SELECT k.surrogate_key AS id, k.natural_key AS type
+    FROM surrogate_key_map k
+    JOIN ({select_income_types_statement}) i ON k.natural_key = i.natural_key
+    WHERE k.dimension = 'IncomeType'
+"""
+
+select_location_table_statement = """
+    SELECT DISTINCT
+      CAST("Seccio_Censal" AS INT) AS section,
+      "Nom_Districte" AS district_name,
+      "Nom_Barri" AS neighborhood_name
+    FROM education_prepared
+"""
+
+select_ac_level_table_statement = """
+    SELECT DISTINCT CAST("Codi_Valor" AS INT) AS id, "Desc_Valor_EN" AS description
+    FROM trusted.meta
+    WHERE "Desc_Dimensio" = 'NIV_EDUCA_esta'
+"""
+
+select_gender_table_statement = """
+    SELECT DISTINCT CAST("Codi_Valor" AS INT) AS id, "Desc_Valor_EN" AS gender
+    FROM trusted.meta
+    WHERE "Desc_Dimensio" = 'SEXE'
+"""
+
+select_income_table_statement = """
+    SELECT
+      it.id AS income_type_id,
+      CAST(i."Periodo" AS INT) AS year,
+      CAST(string_split_regex(trim(i."Secciones"), '\\s+')[4] AS INT) AS section,
+      CAST(i."Total" AS FLOAT) AS value
+    FROM income_prepared i
+    LEFT JOIN income_type_translations t
+      ON i."Indicadores de renta media y mediana" = t.spanish
+    LEFT JOIN IncomeType it
+      ON it.type IS NOT DISTINCT FROM t.english
+"""
+
+select_education_table_statement = """
+    SELECT
+      CAST(split_part("Data_Referencia", '-', 1) AS INT) AS year,
+      CAST(trunc("SEXE") AS INT) AS gender_id,
+      CAST(trunc("NIV_EDUCA_esta") AS INT) AS education_level_id,
+      CAST(trunc("Seccio_Censal") AS INT) AS section,
+      CAST(trunc("Valor") AS INT) AS number_of_people
+    FROM education_prepared
+"""
@@ -0,0 +1,348 @@
+import hashlib
+from enum import Enum
+from data_io.connections import cursor, transaction
+from data_io.data_io import attach_database, table_exists
+from create_table_statements import (
+    create_income_type_table_statement,
+    create_location_table_statement,
+    create_ac_level_table_statement,
+    create_gender_table_statement,
+    create_income_table_statement,
+    create_education_table_statement,
+)
+from select_table_statements import (
+    select_income_types_statement,
+    select_income_type_table_statement,
+    select_location_table_statement,
+    select_ac_level_table_statement,
+    select_gender_table_statement,
+    select_income_table_statement,
+    select_education_table_statement,
+)
+from surrogate_keys import assign_surrogate_keys
+from transformations import INCOME_TYPE_TRANSLATIONS
+
+TRUSTED_ALIAS = "trusted"
+BUILD_STATE_TABLE_NAME = "exploitation_build_state"
+SOURCE_TABLES = ["education", "income", "meta"]
+# recorded with the source fingerprints, so a change of the table definitions
+# rebuilds the star schema instead of refreshing tables of the old layout
+STAR_SCHEMA_STATE_KEY = "star_schema"
+
+
+class RefreshMode(Enum):
+    FULL = 1
+    INCREMENTAL = 2
+
+
+class StarSchemaTable:
+    """
+    A table of the star schema and the query selecting its rows.
+
+    Attributes:
+        name (str): The name of the table.
+        create_statement (str): The statement creating the table.
+        select_statement (str): The query selecting the rows of the table.
+        key_columns (list): For dimensions the columns identifying a row, for facts
+            the columns of the partitions that are replaced as a whole on a refresh.
+        is_fact (bool): Whether the table is a fact table.
+        attribute_columns (list): For dimensions the columns that are updated when
+            they change for an existing key.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        create_statement: str,
+        select_statement: str,
+        key_columns: list,
+        is_fact: bool = False,
+        attribute_columns: list = None,
+    ) -> None:
+        self.name: str = name
+        self.create_statement: str = create_statement
+        self.select_statement: str = select_statement
+        self.key_columns: list = key_columns
+        self.is_fact: bool = is_fact
+        self.attribute_columns: list = attribute_columns or []
+
+    def key_condition(self, left: str, right: str) -> str:
+        return " AND ".join(
+            f"{left}.{column} IS NOT DISTINCT FROM {right}.{column}"
+            for column in self.key_columns
+        )
+
+
+# dimensions before the facts referencing them
+STAR_SCHEMA_TABLES = [
+    StarSchemaTable(
+        "IncomeType",
+        create_income_type_table_statement,
+        select_income_type_table_statement,
+        ["type"],
+    ),
+    StarSchemaTable(
+        "Location",
+        create_location_table_statement,
+        select_location_table_statement,
+        ["section"],
+        attribute_columns=["district_name", "neighborhood_name"],
+    ),
+    StarSchemaTable(
+        "AcademicLevel",
+        create_ac_level_table_statement,
+        select_ac_level_table_statement,
+        ["id"],
+        attribute_columns=["description"],
+    ),
+    StarSchemaTable(
+        "Gender",
+        create_gender_table_statement,
+        select_gender_table_statement,
+        ["id"],
+        attribute_columns=["gender"],
+    ),
+    StarSchemaTable(
+        "Income",
+        create_income_table_statement,
+        select_income_table_statement,
+        ["year", "section"],
+        is_fact=True,
+    ),
+    StarSchemaTable(
+        "Education",
+        create_education_table_statement,
+        select_education_table_statement,
+        ["year", "section"],
+        is_fact=True,
+    ),
+]
+
+
+def star_schema_version() -> str:
+    digest = hashlib.sha256()
+    for table in STAR_SCHEMA_TABLES:
+        digest.update(table.create_statement.encode())
+    return digest.hexdigest()
+
+
+def attach_trusted(exploitation_db_path: str, trusted_db_path: str) -> None:
+    with cursor(exploitation_db_path) as con:
+        attach_database(con, trusted_db_path, TRUSTED_ALIAS)
+
+
+def create_translations_table(con) -> None:
+    con.execute(
+        "CREATE OR REPLACE TEMP TABLE income_type_translations(spanish VARCHAR, english VARCHAR)"
+    )
+    con.executemany(
+        "INSERT INTO income_type_translations VALUES (?, ?)",
+        list(INCOME_TYPE_TRANSLATIONS.items()),
+    )
+
+
+def create_build_state_table(con, replace: bool = False) -> None:
+    create = "CREATE OR REPLACE TABLE" if replace else "CREATE TABLE IF NOT EXISTS"
+    con.execute(f"""
+        {create} {BUILD_STATE_TABLE_NAME}(
+          source_table VARCHAR,
+          fingerprint VARCHAR,
+          built_at TIMESTAMP
+        );
+        """)
+
+
+def source_fingerprints(con) -> dict:
+    """
+    Fingerprint the source tables in the attached trusted zone by their row count
+    and the sum of their row hashes, which does not depend on the row order.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): A connection with trusted.db attached.
+
+    Returns:
+        dict: Source table name to fingerprint.
+    """
+    fingerprints = dict()
+    for table_name in SOURCE_TABLES:
+        count, hash_sum = con.execute(
+            f"SELECT count(*), sum(hash(t)::HUGEINT) FROM {TRUSTED_ALIAS}.{table_name} t"
+        ).fetchone()
+        fingerprints[table_name] = f"{count}:{hash_sum}"
+    return fingerprints
+
+
+def get_changed_source_tables(exploitation_db_path: str, trusted_db_path: str) -> list:
+    """
+    Find the trusted zone tables that changed since the star schema was last built.
+    When the star schema was built with other table definitions, it is reported as
+    changed as well.
+
+    Args:
+        exploitation_db_path (str): The path to the exploitation zone DuckDB database.
+        trusted_db_path (str): The path to the trusted zone DuckDB database.
+
+    Returns:
+        list: The names of the changed source tables, and STAR_SCHEMA_STATE_KEY
+            when the table definitions changed.
+    """
+    attach_trusted(exploitation_db_path, trusted_db_path)
+    with cursor(exploitation_db_path) as con:
+        create_build_state_table(con)
+        built = dict(
+            con.execute(
+                f"SELECT source_table, fingerprint FROM {BUILD_STATE_TABLE_NAME}"
+            ).fetchall()
+        )
+        current = source_fingerprints(con)
+        current[STAR_SCHEMA_STATE_KEY] = star_schema_version()
+    return [t for t in current if built.get(t) != current[t]]
+
+
+def record_source_fingerprints(con) -> None:
+    # replaced rather than updated, as DuckDB rejects re-inserting a deleted key
+    # within the same transaction
+    create_build_state_table(con, replace=True)
+    fingerprints = source_fingerprints(con)
+    fingerprints[STAR_SCHEMA_STATE_KEY] = star_schema_version()
+    for table_name, fingerprint in fingerprints.items():
+        con.execute(
+            f"INSERT INTO {BUILD_STATE_TABLE_NAME} VALUES (?, ?, current_timestamp)",
+            [table_name, fingerprint],
+        )
+
+
+def drop_star_schema(con) -> None:
+    for table in reversed(STAR_SCHEMA_TABLES):
+        con.execute(f"DROP TABLE IF EXISTS {table.name}")
+
+
+def refresh_dimension(con, table: StarSchemaTable) -> None:
+    """
+    Insert the rows of a dimension whose key is not in the table yet and update the
+    attributes of existing keys that changed, so the ids of existing rows stay as
+    they are.
+    """
+    if table.attribute_columns:
+        assignments = ", ".join(f"{c} = s.{c}" for c in table.attribute_columns)
+        changed = " OR ".join(
+            f"d.{c} IS DISTINCT FROM s.{c}" for c in table.attribute_columns
+        )
+        updated = con.execute(f"""
+            UPDATE {table.name} d
+            SET {assignments}
+            FROM ({table.select_statement}) s
+            WHERE {table.key_condition("d", "s")} AND ({changed})
+            """).fetchone()[0]
+        print(f"Updated {updated} changed rows of {table.name} table")
+    inserted = con.execute(f"""
+        INSERT INTO {table.name}
+        SELECT *
+        FROM ({table.select_statement}) s
+        WHERE NOT EXISTS (
+          SELECT 1 FROM {table.name} d WHERE {table.key_condition("d", "s")}
+        )
+        """).fetchone()[0]
+    print(f"Inserted {inserted} new rows into {table.name} table")
+
+
+def refresh_fact(con, table: StarSchemaTable) -> None:
+    """
+    Replace the partitions of a fact table whose rows differ from the source.
+
+    Partitions are compared by their row count and the sum of their row hashes;
+    the changed ones are deleted and selected again from the source.
+    """
+    keys = ", ".join(table.key_columns)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE changed_partitions AS
+        WITH
+          source_partitions AS (
+            SELECT {keys}, count(*) AS n, sum(hash(s)::HUGEINT) AS h
+            FROM ({table.select_statement}) s
+            GROUP BY {keys}
+          ),
+          table_partitions AS (
+            SELECT {keys}, count(*) AS n, sum(hash(f)::HUGEINT) AS h
+            FROM {table.name} f
+            GROUP BY {keys}
+          )
+        SELECT {", ".join(f"coalesce(s.{c}, f.{c}) AS {c}" for c in table.key_columns)}
+        FROM source_partitions s
+        FULL OUTER JOIN table_partitions f ON {table.key_condition("s", "f")}
+        WHERE s.n IS DISTINCT FROM f.n OR s.h IS DISTINCT FROM f.h
+        """)
+    changed = con.execute("SELECT count(*) FROM changed_partitions").fetchone()[0]
+    if changed == 0:
+        print(f"{table.name} table is up to date")
+        return
+    deleted = con.execute(f"""
+        DELETE FROM {table.name} f
+        USING changed_partitions c
+        WHERE {table.key_condition("f", "c")}
+        """).fetchone()[0]
+    inserted = con.execute(f"""
+        INSERT INTO {table.name}
+        SELECT s.*
+        FROM ({table.select_statement}) s
+        JOIN changed_partitions c ON {table.key_condition("s", "c")}
+        """).fetchone()[0]
+    print(
+        f"Refreshed {changed} ({keys}) partitions of {table.name} table: deleted {deleted}, inserted {inserted} rows"
+    )
+
+
+def is_star_schema_outdated(con) -> bool:
+    create_build_state_table(con)
+    built = con.execute(
+        f"SELECT fingerprint FROM {BUILD_STATE_TABLE_NAME} WHERE source_table = ?",
+        [STAR_SCHEMA_STATE_KEY],
+    ).fetchall()
+    return built != [(star_schema_version(),)]
+
+
+def build_star_schema(
+    exploitation_db_path: str,
+    trusted_db_path: str,
+    refresh_mode: RefreshMode = RefreshMode.FULL,
+) -> None:
+    """
+    Build the star schema of the exploitation zone with SQL statements running inside
+    exploitation.db, without loading the data into pandas.
+
+    The prepared tables are read from exploitation.db and the meta table from trusted.db,
+    which is attached read only. A FULL refresh drops and rebuilds every table. An
+    INCREMENTAL refresh only inserts new dimension rows, updates the attributes of
+    existing ones that changed and replaces the fact table partitions that changed,
+    and falls back to a FULL refresh when the star schema was
+    built with other table definitions. Either way the whole refresh is a single
+    transaction, so readers see either the previous or the new star schema.
+
+    The income types get their integer ids from the surrogate key map, so the ids stay
+    the same across runs and refresh modes.
+
+    Args:
+        exploitation_db_path (str): The path to the exploitation zone DuckDB database.
+        trusted_db_path (str): The path to the trusted zone DuckDB database.
+        refresh_mode (RefreshMode): Whether to rebuild or incrementally refresh the tables.
+    """
+    attach_trusted(exploitation_db_path, trusted_db_path)
+    with transaction(exploitation_db_path) as con:
+        create_translations_table(con)
+        if refresh_mode == RefreshMode.FULL or is_star_schema_outdated(con):
+            drop_star_schema(con)
+        new_keys = assign_surrogate_keys(
+            con, "IncomeType", select_income_types_statement
+        )
+        print(f"Assigned {new_keys} new IncomeType keys")
+        for table in STAR_SCHEMA_TABLES:
+            if not table_exists(con, table.name):
+                con.execute(table.create_statement)
+                con.execute(f"INSERT INTO {table.name} {table.select_statement}")
+                rows = con.execute(f"SELECT count(*) FROM {table.name}").fetchone()[0]
+                print(f"Built {table.name} table with {rows} rows")
+            elif table.is_fact:
+                refresh_fact(con, table)
+            else:
+                refresh_dimension(con, table)
+        record_source_fingerprints(con)
@@ -0,0 +1,85 @@
+import pandas as pd
+from data_io.connections import transaction
+
+KEY_MAP_TABLE_NAME = "surrogate_key_map"
+
+
+def create_key_map_table(con) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {KEY_MAP_TABLE_NAME}(
+          dimension VARCHAR,
+          natural_key VARCHAR,
+          surrogate_key INT,
+          PRIMARY KEY (dimension, natural_key)
+        );
+        """)
+
+
+def assign_surrogate_keys(con, dimension: str, natural_keys_query: str) -> int:
+    """
+    Give the natural keys of a dimension that are not in the key map yet the next
+    integer keys of the dimension, in the order of the natural keys.
+
+    Keys already handed out are never changed, so the keys of a dimension stay dense
+    and stable across runs and can be reused by incremental loads.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): A connection to the exploitation zone database.
+        dimension (str): The name of the dimension.
+        natural_keys_query (str): A query selecting the natural keys of the dimension
+            in a natural_key column. NULL keys are left out.
+
+    Returns:
+        int: The number of newly assigned keys.
+    """
+    create_key_map_table(con)
+    return con.execute(
+        f"""
+        INSERT INTO {KEY_MAP_TABLE_NAME}
+        SELECT
+          $dimension,
+          n.natural_key,
+          (
+            SELECT coalesce(max(surrogate_key), 0)
+            FROM {KEY_MAP_TABLE_NAME}
+            WHERE dimension = $dimension
+          ) + row_number() OVER (ORDER BY n.natural_key)
+        FROM (
+          SELECT DISTINCT CAST(k.natural_key AS VARCHAR) AS natural_key
+          FROM ({natural_keys_query}) k
+        ) n
+        WHERE n.natural_key IS NOT NULL
+          AND NOT EXISTS (
+            SELECT 1
+            FROM {KEY_MAP_TABLE_NAME} m
+            WHERE m.dimension = $dimension AND m.natural_key = n.natural_key
+          )
+        """,
+        {"dimension": dimension},
+    ).fetchone()[0]
+
+
+def get_surrogate_keys(path_to_db: str, dimension: str, natural_keys) -> dict:
+    """
+    Look up the integer keys of natural keys of a dimension, assigning keys to the
+    ones seen for the first time.
+
+    Args:
+        path_to_db (str): The path to the exploitation zone DuckDB database.
+        dimension (str): The name of the dimension.
+        natural_keys (list): The natural keys of the dimension.
+
+    Returns:
+        dict: Natural key to its integer key.
+    """
+    natural_keys_df = pd.DataFrame({"natural_key": list(natural_keys)}, dtype=object)
+    with transaction(path_to_db) as con:
+        con.register("natural_keys_df", natural_keys_df)
+        assign_surrogate_keys(con, dimension, "SELECT natural_key FROM natural_keys_df")
+        con.unregister("natural_keys_df")
+        rows = con.execute(
+            f"SELECT natural_key, surrogate_key FROM {KEY_MAP_TABLE_NAME} WHERE dimension = ?",
+            [dimension],
+        ).fetchall()
+    keys = dict(rows)
+    return {key: keys[str(key)] for key in natural_keys if not pd.isnull(key)}
@@ -0,0 +1,49 @@
+import pandas as pd
+
+INCOME_TYPE_TRANSLATIONS = {
+    "Media de la renta por unidad de consumo": "Median income per unit of consumption",
+    "Mediana de la renta por unidad de consumo": "Median income per consumption unit",
+    "Renta bruta media por hogar": "Average gross income per household",
+    "Renta bruta media por persona": "Average gross income per person",
+    "Renta neta media por hogar": "Median net income per household",
+    "Renta neta media por persona ": "Average net income per person",
+}
+
+
+def translate_income_types(income_types: pd.Series) -> pd.Series:
+    """
+    Translate the Spanish income type names to English, unknown names become NaN.
+
+    Args:
+        income_types (pd.Series): The income type names.
+
+    Returns:
+        pd.Series: The translated names.
+    """
+    return income_types.map(INCOME_TYPE_TRANSLATIONS)
+
+
+def normalize_sections(sections: pd.Series) -> pd.Series:
+    """
+    Extract the section number from section descriptions like "0801901001 Barcelona sección 01001".
+
+    Args:
+        sections (pd.Series): The section descriptions.
+
+    Returns:
+        pd.Series: The section numbers as integers.
+    """
+    return sections.astype(str).str.split().str[3].astype(int)
+
+
+def normalize_years(dates: pd.Series) -> pd.Series:
+    """
+    Extract the year from dates like "2015-01-01".
+
+    Args:
+        dates (pd.Series): The dates.
+
+    Returns:
+        pd.Series: The years as integers.
+    """
+    return dates.astype(str).str.split("-", n=1).str[0].astype(int)
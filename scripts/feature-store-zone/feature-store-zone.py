@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+import numpy as np
+from data_io.connections import transaction
+from data_io.data_io import attach_database
+from data_io.feature_store import (
+    FEATURE_STORE_DIR,
+    FEATURE_STORE_DB_PATH,
+    FEATURE_VERSIONS_TABLE_NAME,
+    SPLITS,
+    feature_array_dir,
+)
+from feature_sets import FEATURE_SETS, FeatureSet
+
+FEATURE_STORE_ALIAS = "feature_store"
+
+
+def attach_feature_store(con, feature_store_db_path: str) -> None:
+    attach_database(con, feature_store_db_path, FEATURE_STORE_ALIAS, read_only=False)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {FEATURE_STORE_ALIAS}.{FEATURE_VERSIONS_TABLE_NAME}(
+          feature_set VARCHAR,
+          version INT,
+          table_name VARCHAR,
+          fingerprint VARCHAR,
+          rows BIGINT,
+          created_at TIMESTAMP
+        );
+        """)
+
+
+def export_feature_arrays(
+    con, feature_set: FeatureSet, table_name: str, array_dir: str, batch_size: int
+) -> None:
+    """
+    Write the predictors, target, group and split of a feature table to .npy files
+    that can be memory-mapped, streaming the table in record batches so the memory
+    used does not grow with the table.
+
+    The files are written to a temporary directory that is renamed once complete.
+
+    Raises:
+        ValueError: If an exported column has NULL values, e.g. a level missing
+            from the encoding, which the integer arrays cannot hold.
+    """
+    exported_columns = [
+        *feature_set.predictors,
+        feature_set.target,
+        feature_set.group_column,
+        "split",
+    ]
+    null_counts = con.execute(f"""
+        SELECT {", ".join(f"count(*) - count({c})" for c in exported_columns)}
+        FROM {FEATURE_STORE_ALIAS}.{table_name}
+        """).fetchone()
+    null_columns = [c for c, n in zip(exported_columns, null_counts) if n]
+    if null_columns:
+        raise ValueError(
+            f"Feature set {feature_set.name} has NULL values in columns {null_columns}"
+        )
+    rows = con.execute(
+        f"SELECT count(*) FROM {FEATURE_STORE_ALIAS}.{table_name}"
+    ).fetchone()[0]
+    partial_dir = array_dir + ".partial"
+    if os.path.exists(partial_dir):
+        shutil.rmtree(partial_dir)
+    os.makedirs(partial_dir)
+
+    def open_array(name, dtype, shape):
+        return np.lib.format.open_memmap(
+            os.path.join(partial_dir, f"{name}.npy"),
+            mode="w+",
+            dtype=dtype,
+            shape=shape,
+        )
+
+    arrays = {
+        "X": open_array("X", np.float64, (rows, len(feature_set.predictors))),
+        "y": open_array("y", np.int16, (rows,)),
+        "group": open_array("group", np.int32, (rows,)),
+        "split": open_array("split", np.int8, (rows,)),
+    }
+    split_codes = " ".join(
+        f"WHEN '{split}' THEN {code}" for code, split in enumerate(SPLITS)
+    )
+    reader = con.execute(f"""
+        SELECT
+          {", ".join(f"CAST({p} AS DOUBLE)" for p in feature_set.predictors)},
+          {feature_set.target},
+          {feature_set.group_column},
+          CASE split {split_codes} END
+        FROM {FEATURE_STORE_ALIAS}.{table_name}
+        """).fetch_record_batch(batch_size)
+    n_predictors = len(feature_set.predictors)
+    start = 0
+    for batch in reader:
+        end = start + batch.num_rows
+        columns = [column.to_numpy(zero_copy_only=False) for column in batch.columns]
+        arrays["X"][start:end] = np.column_stack(columns[:n_predictors])
+        arrays["y"][start:end] = columns[-3]
+        arrays["group"][start:end] = columns[-2]
+        arrays["split"][start:end] = columns[-1]
+        start = end
+    for array in arrays.values():
+        array.flush()
+    with open(os.path.join(partial_dir, "columns.json"), "w") as f:
+        json.dump({"arrays": list(arrays), "predictors": feature_set.predictors}, f)
+
+    if os.path.exists(array_dir):
+        shutil.rmtree(array_dir)
+    os.replace(partial_dir, array_dir)
+
+
+def materialize_feature_set(
+    feature_set: FeatureSet,
+    exploitation_db_path: str,
+    feature_store_db_path: str = FEATURE_STORE_DB_PATH,
+    feature_store_dir: str = FEATURE_STORE_DIR,
+    batch_size: int = 100_000,
+) -> int:
+    """
+    Materialize a new version of a feature set when its definition or the rows it
+    is derived from changed since its latest version.
+
+    Every version is kept as its own table of the feature store database, with
+    the feature matrix, target, group and split exported as .npy files next to it.
+    A version is only recorded in the versions table once its files are complete.
+
+    Args:
+        feature_set (FeatureSet): The feature set to materialize.
+        exploitation_db_path (str): The path to the exploitation zone DuckDB database.
+        feature_store_db_path (str): The path to the feature store DuckDB database.
+        feature_store_dir (str): The directory of the feature store zone.
+        batch_size (int): Number of rows exported to the .npy files at a time.
+
+    Returns:
+        int: The latest version of the feature set.
+    """
+    if not os.path.exists(feature_store_dir):
+        print(f"Creating folder: {feature_store_dir}")
+        os.makedirs(feature_store_dir)
+
+    with transaction(exploitation_db_path) as con:
+        attach_feature_store(con, feature_store_db_path)
+        count, hash_sum = con.execute(
+            f"SELECT count(*), sum(hash(f)::HUGEINT) FROM ({feature_set.query}) f"
+        ).fetchone()
+        fingerprint = f"{feature_set.definition_hash()}:{count}:{hash_sum}"
+        latest = con.execute(
+            f"""
+            SELECT version, fingerprint
+            FROM {FEATURE_STORE_ALIAS}.{FEATURE_VERSIONS_TABLE_NAME}
+            WHERE feature_set = ?
+            ORDER BY version DESC
+            LIMIT 1
+            """,
+            [feature_set.name],
+        ).fetchone()
+        if latest is not None and latest[1] == fingerprint:
+            print(
+                f"Feature set {feature_set.name} is up to date at version {latest[0]}"
+            )
+            return latest[0]
+
+        version = 1 if latest is None else latest[0] + 1
+        table_name = f"{feature_set.name}_v{version}"
+        con.execute(
+            f"CREATE OR REPLACE TABLE {FEATURE_STORE_ALIAS}.{table_name} AS {feature_set.query}"
+        )
+        array_dir = feature_array_dir(feature_set.name, version, feature_store_dir)
+        export_feature_arrays(con, feature_set, table_name, array_dir, batch_size)
+        con.execute(
+            f"INSERT INTO {FEATURE_STORE_ALIAS}.{FEATURE_VERSIONS_TABLE_NAME} VALUES (?, ?, ?, ?, ?, current_timestamp)",
+            [feature_set.name, version, table_name, fingerprint, count],
+        )
+    print(
+        f"Materialized {count} rows of feature set {feature_set.name} as version {version} in {table_name} and {array_dir}"
+    )
+    return version
+
+
+exploitation_db_path = "datasets/exploitation-zone/exploitation.db"
+for feature_set in FEATURE_SETS:
+    materialize_feature_set(feature_set, exploitation_db_path)
@@ -0,0 +1,115 @@
+import hashlib
+
+# ordered levels of the ordinal encodings, as traced by the feature generation of the
+# data analysis backbone; the academic levels are encoded from 1, like the five levels
+# of the model, and rows without an academic level are left out
+ACADEMIC_LEVELS = [
+    "Less than primary education",
+    "Primary education",
+    "Lower secondary education",
+    "Upper secondary or post-secondary non-tertiary education",
+    "Tertiary education",
+]
+EXCLUDED_ACADEMIC_LEVELS = ["Not available"]
+GENDERS = ["Female", "Male"]
+# share of the rows of every split, assigned by hashing the key of a row so a row keeps
+# its split across versions
+SPLIT_WEIGHTS = {"train": 70, "test": 15, "valid": 15}
+
+
+class FeatureSet:
+    """
+    A feature table of the feature store zone and the query deriving it from the
+    star schema of the exploitation zone.
+
+    Attributes:
+        name (str): The name of the feature set.
+        query (str): The query selecting the features, with a split column holding
+            the train, test or valid split of every row.
+        predictors (list): The columns exported as the feature matrix.
+        target (str): The column exported as the target.
+        group_column (str): An integer column exported next to them, to select
+            the rows of one group, e.g. of one income type.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        query: str,
+        predictors: list,
+        target: str,
+        group_column: str,
+    ) -> None:
+        self.name: str = name
+        self.query: str = query
+        self.predictors: list = predictors
+        self.target: str = target
+        self.group_column: str = group_column
+
+    def definition_hash(self) -> str:
+        digest = hashlib.sha256()
+        for part in [self.query, *self.predictors, self.target, self.group_column]:
+            digest.update(part.encode())
+            digest.update(b"\x1f")
+        return digest.hexdigest()
+
+
+def level_position(levels: list, column: str) -> str:
+    # 1-based position of the value in the levels, NULL for values that are not
+    # levels, which DuckDB 0.9 reports as position 0
+    return f"nullif(list_position({levels}, {column}), 0)"
+
+
+def split_case(key: str) -> str:
+    bucket = f"CAST(hash({key}) % 100 AS INT)"
+    cases = []
+    upper = 0
+    for split, weight in SPLIT_WEIGHTS.items():
+        upper += weight
+        cases.append(f"WHEN {bucket} < {upper} THEN '{split}'")
+    return "CASE " + " ".join(cases) + " END"
+
+
+income_education_query = f"""
+    WITH sandbox AS (
+      SELECT
+        e.year,
+        e.section,
+        i.income_type_id,
+        it.type AS income_type,
+        i.value AS amount,
+        g.gender,
+        a.description AS academic_level,
+        e.number_of_people
+      FROM Education e
+      JOIN Income i ON i.year = e.year AND i.section = e.section
+      JOIN IncomeType it ON it.id = i.income_type_id
+      JOIN Gender g ON g.id = e.gender_id
+      JOIN AcademicLevel a ON a.id = e.education_level_id
+      WHERE NOT list_contains({EXCLUDED_ACADEMIC_LEVELS}, a.description)
+    )
+    SELECT
+      year,
+      section,
+      income_type_id,
+      income_type,
+      {level_position(ACADEMIC_LEVELS, "academic_level")} AS academic_level_encoded,
+      {level_position(GENDERS, "gender")} - 1 AS gender_encoded,
+      number_of_people,
+      year - min(year) OVER () AS years_elapsed,
+      (amount - avg(amount) OVER (PARTITION BY income_type_id))
+        / stddev_samp(amount) OVER (PARTITION BY income_type_id) AS amount_standardized,
+      {split_case("year, section, income_type_id, gender, academic_level")} AS split
+    FROM sandbox
+    ORDER BY income_type_id, year, section, gender_encoded, academic_level_encoded
+"""
+
+INCOME_EDUCATION = FeatureSet(
+    "income_education",
+    income_education_query,
+    ["amount_standardized", "gender_encoded", "number_of_people", "years_elapsed"],
+    "academic_level_encoded",
+    "income_type_id",
+)
+
+FEATURE_SETS = [INCOME_EDUCATION]
@@ -0,0 +1,28 @@
+EDUCATION_COLUMN_TYPES = {
+    "Data_Referencia": "VARCHAR",
+    "Codi_Districte": "BIGINT",
+    "Nom_Districte": "VARCHAR",
+    "Codi_Barri": "BIGINT",
+    "Nom_Barri": "VARCHAR",
+    "AEB": "BIGINT",
+    "Seccio_Censal": "BIGINT",
+    # kept as text, missing values are encoded as ".." and fixed in the trusted zone
+    "Valor": "VARCHAR",
+    "NIV_EDUCA_esta": "BIGINT",
+    "SEXE": "BIGINT",
+}
+
+META_COLUMN_TYPES = {
+    "Codi_Dimensio": "BIGINT",
+    "Desc_Dimensio": "VARCHAR",
+    "Codi_Valor": "BIGINT",
+    "Desc_Valor_CA": "VARCHAR",
+    "Desc_Valor_ES": "VARCHAR",
+    "Desc_Valor_EN": "VARCHAR",
+}
+
+# categories without an entry are loaded with the types sniffed by DuckDB
+COLUMN_TYPES = {
+    "education": EDUCATION_COLUMN_TYPES,
+    "meta": META_COLUMN_TYPES,
+}
@@ -1,16 +1,167 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
 import duckdb
 import pandas as pd
-from data_io.data_io import write_data
+from data_io.data_io import write_data, table_exists, file_sha256
+from data_io.connections import get_connection
+from column_types import COLUMN_TYPES
 
+LOAD_STATE_TABLE_NAME = "formatted_load_state"
 
-def copy_to_formatted(datasets_root: str, dataset_category: str) -> None:
+
+class IngestionMode(Enum):
+    PANDAS = 1
+    NATIVE = 2
+
+
+def create_load_state_table(con) -> None:
+    """
+    Create the table tracking which persistent files are loaded, if it does not exist.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to the formatted zone database.
+    """
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LOAD_STATE_TABLE_NAME}(
+          table_name VARCHAR PRIMARY KEY,
+          source_file VARCHAR,
+          size BIGINT,
+          mtime DOUBLE,
+          sha256 VARCHAR,
+          loaded_at TIMESTAMP
+        );
+        """)
+
+
+def get_pending_files(con, source_dir: str, source_files: list) -> list:
+    """
+    Select the source files that are new or changed since they were last loaded.
+
+    A file is unchanged if its size and mtime match the load state, or, when
+    only its mtime differs, if its content hash does.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to the formatted zone database.
+        source_dir (str): The directory of the source files.
+        source_files (list): The names of the source files.
+
+    Returns:
+        list: (source file, (size, mtime, sha256)) tuples of the files to load.
+    """
+    load_state = {
+        row[0]: row[1:]
+        for row in con.execute(
+            f"SELECT table_name, size, mtime, sha256 FROM {LOAD_STATE_TABLE_NAME}"
+        ).fetchall()
+    }
+
+    pending_files = []
+    for source_file in source_files:
+        source_file_path = os.path.join(source_dir, source_file)
+        table_name = os.path.splitext(source_file)[0]
+        stat = os.stat(source_file_path)
+        state = load_state.get(table_name)
+        # hashed at most once, when neither the load state nor the size rules it out
+        current_sha256 = None
+        if state is not None and table_exists(con, table_name):
+            size, mtime, sha256 = state
+            if size == stat.st_size and mtime == stat.st_mtime:
+                continue
+            if size == stat.st_size:
+                current_sha256 = file_sha256(source_file_path)
+                if sha256 == current_sha256:
+                    record_loaded_file(
+                        con, source_file, (stat.st_size, stat.st_mtime, sha256)
+                    )
+                    continue
+        if current_sha256 is None:
+            current_sha256 = file_sha256(source_file_path)
+        pending_files.append(
+            (source_file, (stat.st_size, stat.st_mtime, current_sha256))
+        )
+    return pending_files
+
+
+def record_loaded_file(con, source_file: str, fingerprint: tuple) -> None:
     """
-    Copy CSV files from the landing zone to the formatted zone in a DuckDB database.
+    Store the fingerprint of a loaded source file in the load state table.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to the formatted zone database.
+        source_file (str): The name of the loaded source file.
+        fingerprint (tuple): The (size, mtime, sha256) of the file.
+    """
+    table_name = os.path.splitext(source_file)[0]
+    con.execute(
+        f"INSERT OR REPLACE INTO {LOAD_STATE_TABLE_NAME} "
+        "VALUES (?, ?, ?, ?, ?, current_timestamp)",
+        [table_name, source_file, *fingerprint],
+    )
+
+
+def load_csv_with_pandas(source_file_path: str, db_file_path: str, table_name: str):
+    """
+    Load a CSV file into a DuckDB table by parsing it with pandas first.
+
+    Args:
+        source_file_path (str): The path to the CSV file.
+        db_file_path (str): The path to the DuckDB database.
+        table_name (str): The name of the table to write.
+    """
+    df = pd.read_csv(source_file_path)
+    write_data(df, db_file_path, table_name)
+
+
+def load_csv_natively(
+    con, source_file_path: str, table_name: str, column_types: dict = None
+) -> None:
+    """
+    Load a CSV file into a DuckDB table with DuckDB's own CSV reader.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection (or cursor) to use.
+        source_file_path (str): The path to the CSV file.
+        table_name (str): The name of the table to write.
+        column_types (dict): Column name to DuckDB type mapping; sniffed when None.
+    """
+    if column_types is None:
+        con.execute(
+            f"CREATE OR REPLACE TABLE {table_name} AS "
+            "SELECT * FROM read_csv_auto(?, header=true)",
+            [source_file_path],
+        )
+    else:
+        con.execute(
+            f"CREATE OR REPLACE TABLE {table_name} AS "
+            "SELECT * FROM read_csv(?, header=true, columns=?)",
+            [source_file_path, column_types],
+        )
+
+
+def copy_to_formatted(
+    datasets_root: str,
+    dataset_category: str,
+    mode: IngestionMode = IngestionMode.NATIVE,
+    max_workers: int = None,
+    full_refresh: bool = False,
+) -> None:
+    """
+    Copy new or changed CSV files from the landing zone to the formatted zone in a DuckDB database.
+
+    Loaded files are fingerprinted in the load state table, so files that did not
+    change since their last load are skipped unless a full refresh is requested.
+
+    In NATIVE mode the files are scanned by DuckDB directly into the database,
+    in parallel over cursors of one shared connection. Files that DuckDB can not
+    load are retried through the PANDAS path.
 
     Args:
         datasets_root (str): The root directory of the datasets.
         dataset_category (str): The category of the dataset to copy.
+        mode (IngestionMode): How the CSV files are parsed and written.
+        max_workers (int): Number of files loaded concurrently in NATIVE mode.
+        full_refresh (bool): Reload every file regardless of the load state.
 
     Returns:
         None
@@ -37,13 +188,53 @@ def copy_to_formatted(datasets_root: str, dataset_category: str) -> None:
 
     db_file_path = os.path.join(target_dir, "formatted.db")
 
-    con = duckdb.connect(db_file_path)
-    for source_file in source_files:
+    con = get_connection(db_file_path)
+    create_load_state_table(con)
+    if full_refresh:
+        con.execute(f"DELETE FROM {LOAD_STATE_TABLE_NAME}")
+    pending_files = get_pending_files(con, source_dir, source_files)
+    print(
+        f"{len(pending_files)} out of {len(source_files)} file(s) of {dataset_category} are new or changed"
+    )
+    if not pending_files:
+        return
+    fingerprints = dict(pending_files)
+
+    if mode == IngestionMode.PANDAS:
+        failed_files = [(source_file, None) for source_file, _ in pending_files]
+    else:
+        column_types = COLUMN_TYPES.get(dataset_category)
+
+        def load(source_file: str) -> tuple:
+            source_file_path = os.path.join(source_dir, source_file)
+            dataset_name = os.path.splitext(source_file)[0]
+            cursor = con.cursor()
+            try:
+                load_csv_natively(cursor, source_file_path, dataset_name, column_types)
+                record_loaded_file(cursor, source_file, fingerprints[source_file])
+                return source_file, None
+            except duckdb.Error as e:
+                return source_file, e
+            finally:
+                cursor.close()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(load, fingerprints))
+
+        failed_files = [(f, e) for f, e in results if e is not None]
+        print(
+            f"Loaded {len(results) - len(failed_files)} file(s) of {dataset_category} natively"
+        )
+
+    for source_file, error in failed_files:
+        if error is not None:
+            print(
+                f"Native load of {source_file} failed ({error}), falling back to pandas"
+            )
         source_file_path = os.path.join(source_dir, source_file)
         dataset_name = os.path.splitext(source_file)[0]
-        df = pd.read_csv(source_file_path)
-        write_data(df, db_file_path, dataset_name)
-    con.close()
+        load_csv_with_pandas(source_file_path, db_file_path, dataset_name)
+        record_loaded_file(con, source_file, fingerprints[source_file])
 
 
 datasets_root = "datasets"
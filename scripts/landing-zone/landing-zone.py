@@ -1,12 +1,27 @@
 import shutil
 import os
 import time
+import pandas as pd
+from data_io.data_io import load_data, write_data, file_sha256
+
+MANIFEST_TABLE_NAME = "landing_manifest"
+MANIFEST_COLUMNS = [
+    "dataset_category",
+    "source_file",
+    "sha256",
+    "size",
+    "mtime",
+    "version",
+    "target_file",
+]
 
 
 def get_latest_version(target_dir: str, dataset_category: str) -> int:
     """
     Get the latest version number for a dataset category in the target directory.
 
+    Files are expected to be named as {dataset_category}_{timestamp}_v{version}.{extension}.
+
     Args:
         target_dir (str): Target directory where files are stored.
         dataset_category (str): Descriptive name of the dataset.
@@ -16,22 +31,132 @@ def get_latest_version(target_dir: str, dataset_category: str) -> int:
     """
     version_numbers = set()
     for existing_file in os.listdir(target_dir):
-        if existing_file.startswith(f"{dataset_category}-"):
-            parts = existing_file.split("-")
-            if len(parts) == 3 and parts[2].isdigit():
-                version_numbers.add(int(parts[2]))
+        version = parse_version(existing_file, dataset_category)
+        if version is not None:
+            version_numbers.add(version)
 
     return max(version_numbers, default=0)
 
 
-def copy_files_to_persistent(datasets_root: str, dataset_category: str) -> None:
+def reflink(source_file_path: str, target_file_path: str) -> None:
+    """
+    Create a copy-on-write clone of a file (Linux FICLONE ioctl).
+
+    Raises:
+        OSError: If the platform or file system does not support reflinks.
+    """
+    import fcntl
+
+    ficlone = 0x40049409
+    with open(source_file_path, "rb") as src, open(target_file_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target_file_path)
+            raise
+
+
+def link_or_copy(source_file_path: str, target_file_path: str) -> str:
+    """
+    Place a file in the persistent zone without duplicating its bytes when possible.
+
+    A reflink is tried first, as it is copy-on-write and the persistent version stays
+    intact even if the temporal file is later edited in place. Otherwise the file is
+    copied. Hardlinks are never used, as they would share the inode with the mutable
+    temporal file and let in-place edits rewrite persisted versions.
+
+    Returns:
+        str: The method used, either "reflink" or "copy".
+    """
+    try:
+        reflink(source_file_path, target_file_path)
+        return "reflink"
+    except (OSError, ImportError):
+        pass
+    shutil.copy2(source_file_path, target_file_path)
+    return "copy"
+
+
+def parse_version(file_name: str, dataset_category: str) -> int:
+    """
+    Parse the version of a persistent file named {dataset_category}_{timestamp}_v{version}.{extension}.
+
+    Returns:
+        int: The version number, or None if the name does not follow the convention.
+    """
+    parts = os.path.splitext(file_name)[0].rsplit("_", 2)
+    if (
+        len(parts) == 3
+        and parts[0] == dataset_category
+        and parts[1].isdigit()
+        and parts[2].startswith("v")
+        and parts[2][1:].isdigit()
+    ):
+        return int(parts[2][1:])
+    return None
+
+
+def load_manifest(manifest_db_path: str) -> pd.DataFrame:
+    """
+    Load the landing-zone manifest, or an empty one if it does not exist yet.
+
+    Args:
+        manifest_db_path (str): The path to the DuckDB database holding the manifest.
+
+    Returns:
+        pd.DataFrame: One row per ingested (source file, content) pair.
+    """
+    if not os.path.exists(manifest_db_path):
+        return pd.DataFrame(columns=MANIFEST_COLUMNS)
+    manifest_df = load_data(manifest_db_path, MANIFEST_TABLE_NAME)
+    if manifest_df.empty:
+        return pd.DataFrame(columns=MANIFEST_COLUMNS)
+    return manifest_df
+
+
+def index_untracked_files(
+    target_dir: str, dataset_category: str, tracked_files: set
+) -> pd.DataFrame:
+    """
+    Hash persistent files that are not in the manifest yet, e.g. the ones stored
+    before the manifest existed, so their content is not copied again.
+
+    Args:
+        target_dir (str): The persistent directory of the dataset category.
+        dataset_category (str): Descriptive name of the dataset.
+        tracked_files (set): Persistent file names already in the manifest.
+
+    Returns:
+        pd.DataFrame: Version and file name of the untracked files, indexed by hash.
+    """
+    rows = []
+    for existing_file in sorted(os.listdir(target_dir)):
+        version = parse_version(existing_file, dataset_category)
+        if existing_file in tracked_files or version is None:
+            continue
+        sha256 = file_sha256(os.path.join(target_dir, existing_file))
+        rows.append((sha256, version, existing_file))
+    untracked_df = pd.DataFrame(rows, columns=["sha256", "version", "target_file"])
+    return untracked_df.drop_duplicates("sha256").set_index("sha256")
+
+
+def copy_files_to_persistent(
+    datasets_root: str, dataset_category: str, manifest_db_path: str = None
+) -> None:
     """
-    Copies files from the temporal directory to the persistent directory
+    Copies new or changed files from the temporal directory to the persistent directory
     while renaming them according to a specified naming convention.
 
+    Every ingested file is recorded in a manifest with its hash, size and mtime.
+    Files whose size and mtime match the manifest are skipped without being read,
+    files whose content is already stored are skipped after hashing.
+
     Args:
         datasets_root (str): Root folder containing the landing-zone subfolder.
         dataset_category (str): Descriptive name of the dataset.
+        manifest_db_path (str): DuckDB file holding the manifest; defaults to
+            manifest.db in the persistent landing zone.
 
     Returns:
         None
@@ -39,6 +164,11 @@ def copy_files_to_persistent(datasets_root: str, dataset_category: str) -> None:
     source_dir = os.path.join(
         datasets_root, "landing-zone", "temporal", dataset_category
     )
+    if not os.path.exists(source_dir):
+        print(
+            f"No such dataset category as {dataset_category} in the temporal landing zone"
+        )
+        return
 
     persistent_dir = os.path.join(datasets_root, "landing-zone", "persistent")
 
@@ -46,6 +176,9 @@ def copy_files_to_persistent(datasets_root: str, dataset_category: str) -> None:
         print(f"Creating folder: {persistent_dir}")
         os.makedirs(persistent_dir)
 
+    if manifest_db_path is None:
+        manifest_db_path = os.path.join(persistent_dir, "manifest.db")
+
     target_dir = os.path.join(
         datasets_root, "landing-zone", "persistent", dataset_category
     )
@@ -54,29 +187,91 @@ def copy_files_to_persistent(datasets_root: str, dataset_category: str) -> None:
         print(f"Creating folder: {target_dir}")
         os.makedirs(target_dir)
 
-    timestamp = int(time.time())
-    latest_version = get_latest_version(target_dir, dataset_category)
-
-    source_files = os.listdir(source_dir)
+    source_files = sorted(os.listdir(source_dir))
     if not source_files:
         print("There are no files to copy")
         return
 
+    manifest_df = load_manifest(manifest_db_path)
+    category_manifest = manifest_df[manifest_df["dataset_category"] == dataset_category]
+    latest_by_source = category_manifest.drop_duplicates(
+        "source_file", keep="last"
+    ).set_index("source_file")
+    stored_df = pd.concat(
+        [
+            category_manifest.set_index("sha256"),
+            index_untracked_files(
+                target_dir, dataset_category, set(category_manifest["target_file"])
+            ),
+        ]
+    )
+    stored_df = stored_df[~stored_df.index.duplicated()]
+    stored_by_hash = {
+        sha256: (version, target_file)
+        for sha256, version, target_file in zip(
+            stored_df.index, stored_df["version"], stored_df["target_file"]
+        )
+    }
+
+    timestamp = int(time.time())
+    latest_version = max(
+        get_latest_version(target_dir, dataset_category),
+        int(category_manifest["version"].max()) if len(category_manifest) else 0,
+    )
+
+    new_entries = []
+    copied_files = 0
     for source_file in source_files:
         source_file_path = os.path.join(source_dir, source_file)
+        stat = os.stat(source_file_path)
+
+        if source_file in latest_by_source.index:
+            known = latest_by_source.loc[source_file]
+            if known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                continue
 
-        file_extension = os.path.splitext(source_file)[1]
+        sha256 = file_sha256(source_file_path)
+        if sha256 in stored_by_hash:
+            version, target_file_name = stored_by_hash[sha256]
+            print(f"{source_file_path} is unchanged, stored as {target_file_name}")
+        else:
+            file_extension = os.path.splitext(source_file)[1]
+            latest_version += 1
+            version = latest_version
+            target_file_name = (
+                f"{dataset_category}_{timestamp}_v{version}{file_extension}"
+            )
+            target_file_path = os.path.join(target_dir, target_file_name)
 
-        latest_version += 1
-        target_file_name = (
-            f"{dataset_category}_{timestamp}_v{latest_version}{file_extension}"
+            method = link_or_copy(source_file_path, target_file_path)
+            print(f"Copied ({method}) {source_file_path} to {target_file_path}")
+            copied_files += 1
+            stored_by_hash[sha256] = (version, target_file_name)
+
+        new_entries.append(
+            (
+                dataset_category,
+                source_file,
+                sha256,
+                stat.st_size,
+                stat.st_mtime,
+                int(version),
+                target_file_name,
+            )
         )
-        target_file_path = os.path.join(target_dir, target_file_name)
 
-        print(f"Copying {source_file_path} to {target_file_path}")
-        shutil.copy(source_file_path, target_file_path)
+    if new_entries:
+        manifest_df = pd.concat(
+            [manifest_df, pd.DataFrame(new_entries, columns=MANIFEST_COLUMNS)],
+            ignore_index=True,
+        )
+        manifest_df = manifest_df.astype({"size": "int64", "version": "int64"})
+        write_data(manifest_df, manifest_db_path, MANIFEST_TABLE_NAME)
 
-    print(f"Copied {len(source_files)} files to {target_dir}")
+    print(
+        f"Copied {copied_files} new file(s) to {target_dir}, "
+        f"{len(source_files) - copied_files} unchanged"
+    )
 
 
 datasets_root = "datasets"
@@ -2,12 +2,21 @@ from enum import Enum
 import os
 from abc import ABC, abstractmethod
 import pandas as pd
-import duckdb
-from sklearn.impute import SimpleImputer
+import pyarrow as pa
 import numpy as np
-from pyod.models.knn import KNN
-from helper_functions import compare_dataframe_schemas, tm_outliers
-from data_io.data_io import table_exists
+from helper_functions import tm_outlier_mask
+from multivariate_outliers import MultiOutlierDetector, find_multi_outliers
+from schema_registry import SchemaRegistry, SchemaCheckResult, select_with_schema
+from sql_engine import (
+    FORMATTED_ALIAS,
+    merged_source_query,
+    deduplicated_query,
+    uni_outlier_flags_query,
+    uni_outlier_counts_query,
+    without_uni_outliers_query,
+)
+from data_io.data_io import attach_database, table_exists, fetch_record_batches
+from data_io.connections import cursor, transaction
 
 
 class OutlierRemovalMode(Enum):
@@ -17,6 +26,41 @@ class OutlierRemovalMode(Enum):
     NONE = 4
 
 
+class ExecutionEngine(Enum):
+    PANDAS = 1
+    DUCKDB = 2
+
+
+def empty_column(num_rows: int, dtype):
+    """
+    Allocate a column of num_rows values of a pandas dtype, as a numpy array for
+    numpy dtypes and as an extension array, filled with missing values, for
+    extension dtypes such as string, Int64 or category.
+    """
+    if isinstance(dtype, np.dtype):
+        return np.empty(num_rows, dtype=dtype)
+    return pd.array([], dtype=dtype).take(np.full(num_rows, -1), allow_fill=True)
+
+
+def widen_column(column, dtype):
+    """
+    Cast a preallocated column to the dtype pandas would concatenate it with values
+    of dtype to, when its own dtype cannot hold them.
+    """
+    if column.dtype == dtype:
+        return column
+    if isinstance(column, np.ndarray) and isinstance(dtype, np.dtype):
+        if np.can_cast(dtype, column.dtype):
+            return column
+        return column.astype(np.result_type(column.dtype, dtype))
+    common_dtype = pd.concat([pd.Series(column[:0]), pd.Series([], dtype=dtype)]).dtype
+    if common_dtype == column.dtype:
+        return column
+    if isinstance(common_dtype, np.dtype):
+        return np.asarray(column, dtype=common_dtype)
+    return pd.array(column, dtype=common_dtype)
+
+
 class Dataset(ABC):
     def __init__(
         self,
@@ -26,6 +70,13 @@ class Dataset(ABC):
         outlier_removal_mode: OutlierRemovalMode,
         path_to_datasets_root: str,
         cleaning_function=None,
+        streaming: bool = False,
+        batch_size: int = 100_000,
+        engine: ExecutionEngine = ExecutionEngine.PANDAS,
+        sql_cleaning_expressions: dict = None,
+        multi_outlier_detector: MultiOutlierDetector = MultiOutlierDetector.KNN,
+        multi_outlier_sample_size: int = None,
+        max_workers: int = None,
     ) -> None:
         self.dataset_category: str = dataset_category
         self.path_to_source_db: str = path_to_source_db
@@ -33,7 +84,30 @@ class Dataset(ABC):
         self.outlier_removal_mode: OutlierRemovalMode = outlier_removal_mode
         self.path_to_datasets_root: str = path_to_datasets_root
         self.cleaning_function = cleaning_function
-        self.table_name_df_tuples: list = None
+        # in streaming mode the formatted tables are merged by DuckDB and read in batches
+        self.streaming: bool = streaming
+        self.batch_size: int = batch_size
+        # the DUCKDB engine runs every step as SQL and writes straight into trusted.db,
+        # the cleaning function is then replaced by SQL expressions per column
+        self.engine: ExecutionEngine = engine
+        self.sql_cleaning_expressions: dict = sql_cleaning_expressions
+        # one detector is fitted per type value, in parallel worker processes;
+        # with a sample size the detectors are fitted on a sample and score every row
+        self.multi_outlier_detector: MultiOutlierDetector = multi_outlier_detector
+        self.multi_outlier_sample_size: int = multi_outlier_sample_size
+        self.max_workers: int = max_workers
+        if engine == ExecutionEngine.DUCKDB and outlier_removal_mode in (
+            OutlierRemovalMode.MULTI,
+            OutlierRemovalMode.BOTH,
+        ):
+            raise ValueError(
+                "Multivariate outlier removal is not supported by the DUCKDB engine"
+            )
+        # query of the current state of the dataset when running on the DUCKDB engine
+        self.query: str = None
+        self.schema_check: SchemaCheckResult = None
+        # (table name, pyarrow.Table) tuples of the formatted tables
+        self.table_name_table_tuples: list = None
         self.df: pd.DataFrame = None
         self.stripped_df: pd.DataFrame = None
         self.uni_outliers: dict = None
@@ -44,25 +118,44 @@ class Dataset(ABC):
         pass
 
     def load_formatted_data(self) -> None:
+        print(f"Reading formatted table schemas for {self.dataset_category}...")
+        self.schema_check = SchemaRegistry(self.path_to_source_db).check(
+            self.dataset_category
+        )
+        print(f"Found {len(self.schema_check.table_names)} table(s)")
+        if self.streaming or self.engine == ExecutionEngine.DUCKDB:
+            return
+
         print(f"Loading formatted data for {self.dataset_category}...")
-        con = duckdb.connect(self.path_to_source_db)
-        tables = con.sql("show all tables").df()
-        table_names = set(
-            [
-                table
-                for table in tables["name"]
-                if table.startswith(self.dataset_category)
+        with cursor(self.path_to_source_db) as con:
+            self.table_name_table_tuples = [
+                (table_name, con.sql(self.__select_formatted(table_name)).arrow())
+                for table_name in self.schema_check.table_names
             ]
-        )
+        print(f"Loaded {len(self.table_name_table_tuples)} table(s)")
 
-        self.table_name_df_tuples = [
-            (table_name, con.sql(f"select * from {table_name}").df())
-            for table_name in table_names
-        ]
-        con.close()
-        print(f"Loaded {len(self.table_name_df_tuples)} table(s)")
+    def __select_formatted(self, table_name: str) -> str:
+        if not self.schema_check.mergeable:
+            return f"select * from {table_name}"
+        return select_with_schema(table_name, self.schema_check.merged_schema)
+
+    def __trusted_db_path(self) -> str:
+        target_dir = os.path.join(self.path_to_datasets_root, "trusted-zone")
+        if not os.path.exists(target_dir):
+            print(f"Creating folder: {target_dir}")
+            os.makedirs(target_dir)
+        return os.path.join(target_dir, "trusted.db")
+
+    def __sql(self, query: str) -> pd.DataFrame:
+        with cursor(self.__trusted_db_path()) as con:
+            attach_database(con, self.path_to_source_db, FORMATTED_ALIAS)
+            return con.sql(query).df()
 
     def perform_eda(self) -> None:
+        if self.engine == ExecutionEngine.DUCKDB and self.query is not None:
+            print("Summary:")
+            print(self.__sql(f"SUMMARIZE {self.query}").to_string())
+            return
         if self.df is None:
             print("Dataframe not initialized yet, cannot perform eda.")
             return
@@ -86,32 +179,71 @@ class Dataset(ABC):
             else:
                 print("Too many unique values to display")
 
-    def __mergeability_condition(self) -> bool:
-        if len(self.table_name_df_tuples) == 1:
-            return True
-
-        mergeable = True
-        for df_i in self.table_name_df_tuples:
-            for df_j in self.table_name_df_tuples:
-                if df_i[0] != df_j[0]:
-                    if not compare_dataframe_schemas(
-                        df_i[1], df_j[1], df_i[0], df_j[0]
-                    ):
-                        mergeable = False
-        return mergeable
+    def __stream_merged_df(self) -> pd.DataFrame:
+        query = " UNION ALL ".join(
+            self.__select_formatted(table_name)
+            for table_name in self.schema_check.table_names
+        )
+        with cursor(self.path_to_source_db) as con:
+            num_rows = con.execute(f"select count(*) from ({query})").fetchone()[0]
+
+        # every batch is written into preallocated columns, so the per-table frames
+        # and the pd.concat copy are never held; the merged frame itself still grows
+        # with the data, as the pandas quality steps need all of its rows
+        columns = dict()
+        start = 0
+        for batch in fetch_record_batches(
+            query, self.path_to_source_db, self.batch_size
+        ):
+            piece = batch.to_pandas()
+            end = start + len(piece)
+            for name, values in piece.items():
+                if name not in columns:
+                    columns[name] = empty_column(num_rows, values.dtype)
+                else:
+                    columns[name] = widen_column(columns[name], values.dtype)
+                if isinstance(columns[name], np.ndarray):
+                    columns[name][start:end] = values.to_numpy()
+                else:
+                    columns[name][start:end] = values.array
+            start = end
+
+        df = pd.DataFrame(index=pd.RangeIndex(num_rows))
+        for name in list(columns):
+            df[name] = columns.pop(name)
+        return df
 
     def merge_dfs(self):
-        mergeable = self.__mergeability_condition()
-        if not mergeable:
+        self.schema_check.report()
+        if not self.schema_check.mergeable:
             raise Exception(
                 f"Can not merge formatted tables of {self.dataset_category}"
             )
-        if len(self.table_name_df_tuples) == 1:
-            self.df = self.table_name_df_tuples[0][1]
+        if self.engine == ExecutionEngine.DUCKDB:
+            self.query = merged_source_query(
+                self.schema_check.table_names,
+                self.schema_check.merged_schema,
+                self.sql_cleaning_expressions,
+            )
+            return
+        if self.streaming:
+            self.df = self.__stream_merged_df()
+            if (
+                len(self.schema_check.table_names) > 1
+                and self.cleaning_function is not None
+            ):
+                self.df = self.cleaning_function(self.df)
             self.__strip_df()
             return
-        list_of_dfs = [i[1] for i in self.table_name_df_tuples]
-        self.df = pd.concat(list_of_dfs, ignore_index=True)
+
+        if len(self.table_name_table_tuples) == 1:
+            self.df = self.table_name_table_tuples[0][1].to_pandas()
+            self.__strip_df()
+            return
+        # concatenating Arrow tables only chains their chunks, so the rows are
+        # converted to pandas once instead of once per table and again by pd.concat
+        list_of_tables = [i[1] for i in self.table_name_table_tuples]
+        self.df = pa.concat_tables(list_of_tables).to_pandas()
         # additional cleaning
         if self.cleaning_function is not None:
             self.df = self.cleaning_function(self.df)
@@ -142,42 +274,37 @@ class Dataset(ABC):
         print(len(headline) * "-")
 
     def _find_uni_outliers(self, strict: bool) -> None:
-        types = self.df[self.important_columns["type"]].unique()
-        targets = self.important_columns["targets"]
+        # target -> boolean mask of the rows that are outliers within their type
         self.uni_outliers = dict()
-        for t in types:
-            for target in targets:
-                self.uni_outliers[str(t) + "_" + str(target)] = tm_outliers(
-                    self.df[self.df[self.important_columns["type"]] == t],
-                    target,
-                    strict,
-                )
+        for target in self.important_columns["targets"]:
+            self.uni_outliers[target] = tm_outlier_mask(
+                self.df, self.important_columns["type"], target, strict
+            )
         return self.uni_outliers
 
     def _summarize_uni_outliers(self) -> None:
-        for var in self.uni_outliers.keys():
-            outliers = [o for o in self.uni_outliers[var]]
-            print(
-                f"{len(outliers)} out of {len(self.df)} samples were univariate outliers of {var} variable in the {self.dataset_category} data"
-            )
+        type_column = self.df[self.important_columns["type"]]
+        counts = {
+            target: mask.groupby(type_column, sort=False, dropna=False).sum()
+            for target, mask in self.uni_outliers.items()
+        }
+        for t in type_column.unique():
+            for target in self.uni_outliers.keys():
+                print(
+                    f"{counts[target][t]} out of {len(self.df)} samples were univariate outliers of {t}_{target} variable in the {self.dataset_category} data"
+                )
 
     def _find_multi_outliers(self) -> None:
         if len(self.important_columns["targets"]) == 1:
             return
-        self.multi_outliers = []
-        types = self.df[self.important_columns["type"]].unique()
-        for t in types:
-            df = self.stripped_df[self.stripped_df[self.important_columns["type"]] == t]
-            # NaN values temporarily imputed by mean
-            imputer = SimpleImputer(missing_values=np.nan, strategy="mean")
-            imputer = imputer.fit(df.copy())
-            imputed_df = imputer.transform(df.copy().values)
-            clf = KNN()
-            clf.fit(imputed_df)
-            outliers = clf.predict(imputed_df)
-            outliers = outliers.astype(bool)
-            outliers = np.invert(outliers)
-            self.multi_outliers.append(outliers)
+        self.multi_outliers = find_multi_outliers(
+            self.df,
+            self.important_columns["type"],
+            self.important_columns["targets"],
+            detector=self.multi_outlier_detector,
+            sample_size=self.multi_outlier_sample_size,
+            max_workers=self.max_workers,
+        )
         return self.multi_outliers
 
     def _summarize_multi_outliers(self) -> None:
@@ -186,17 +313,17 @@ class Dataset(ABC):
                 "There is only one column, no need for multivariate outlier detection"
             )
             return
-        nr_mv_outliers = len([o for o in self.multi_outliers if not o])
+        nr_mv_outliers = int(self.multi_outliers.sum())
         print(
             f"{nr_mv_outliers} out of {len(self.multi_outliers)} samples are multivariate outliers in {self.dataset_category} dataset"
         )
 
     def __remove_uni_outliers(self) -> None:
-        outliers = [item for sublist in self.uni_outliers.values() for item in sublist]
-        self.df.drop(outliers, inplace=True)
+        outliers = np.logical_or.reduce(list(self.uni_outliers.values()))
+        self.df = self.df[~outliers]
 
     def __remove_multi_outliers(self) -> None:
-        self.df = self.df[self.multi_outliers]
+        self.df = self.df[~self.multi_outliers]
 
     def _remove_outliers(self) -> None:
         headline = 20 * "-" + "Outlier removal" + 20 * "-"
@@ -213,35 +340,83 @@ class Dataset(ABC):
         print(f"Removed {starting_size - len(self.df)} out of {starting_size} rows")
         print(len(headline) * "-")
 
-    def copy_to_trusted(self) -> None:
-        target_dir = os.path.join(self.path_to_datasets_root, "trusted-zone")
-        if not os.path.exists(target_dir):
-            print(f"Creating folder: {target_dir}")
-            os.makedirs(target_dir)
+    def _perform_sql_deduplication(self) -> None:
+        headline = 20 * "-" + "Deduplication" + 20 * "-"
+        print(headline)
+        num_rows, num_distinct_rows = self.__sql(f"""
+            select (select count(*) from ({self.query})),
+                   (select count(*) from ({deduplicated_query(self.query)}))
+            """).iloc[0]
+        print("Number of duplicate rows:", num_rows - num_distinct_rows)
+        if num_rows > num_distinct_rows:
+            print("Removing duplicates...")
+            self.query = deduplicated_query(self.query)
+            print("Removed duplicates")
+        print(len(headline) * "-")
 
-        db_file_path = os.path.join(target_dir, "trusted.db")
+    def _find_sql_uni_outliers(self, strict: bool) -> None:
+        type_column = self.important_columns["type"]
+        targets = self.important_columns["targets"]
+        flags_query = uni_outlier_flags_query(self.query, type_column, targets, strict)
+        counts = self.__sql(uni_outlier_counts_query(flags_query, type_column, targets))
+        num_rows = self.__sql(f"select count(*) from ({self.query})").iloc[0, 0]
+        for _, row in counts.iterrows():
+            for target in targets:
+                print(
+                    f"{row[target]} out of {num_rows} samples were univariate outliers of {row[type_column]}_{target} variable in the {self.dataset_category} data"
+                )
+        self.uni_outliers = flags_query
+
+    def _remove_sql_outliers(self) -> None:
+        headline = 20 * "-" + "Outlier removal" + 20 * "-"
+        print(headline)
+        starting_size = self.__sql(f"select count(*) from ({self.query})").iloc[0, 0]
+        if self.outlier_removal_mode == OutlierRemovalMode.NONE:
+            print("No outlier will be removed.")
+        elif self.outlier_removal_mode == OutlierRemovalMode.UNI:
+            print("Removing univariate outliers")
+            self.query = without_uni_outliers_query(
+                self.uni_outliers,
+                list(self.schema_check.merged_schema),
+                self.important_columns["targets"],
+            )
+        size = self.__sql(f"select count(*) from ({self.query})").iloc[0, 0]
+        print(f"Removed {starting_size - size} out of {starting_size} rows")
+        print(len(headline) * "-")
+
+    def copy_to_trusted(self) -> None:
+        db_file_path = self.__trusted_db_path()
         if not os.path.exists(db_file_path):
             print("Creating db file for trusted zone")
-            con = duckdb.connect(db_file_path)
-            con.close()  # this should create the file
 
-        con = duckdb.connect(db_file_path)
-        df_to_save = self.df
-        if not table_exists(con, self.dataset_category):
-            print(
-                f"Table {self.dataset_category} does not exist, creating with {len(df_to_save)} rows..."
-            )
-            con.execute(
-                f"CREATE TABLE {self.dataset_category} AS SELECT * FROM df_to_save"
-            )
-            print("Saved dataset to table")
-        else:
-            print("Overwriting dataset in table")
-            con.execute(f"DROP TABLE {self.dataset_category}")
-            con.execute(
-                f"CREATE TABLE {self.dataset_category} AS SELECT * FROM df_to_save"
-            )
-        con.close()
+        if self.engine == ExecutionEngine.DUCKDB:
+            with cursor(db_file_path) as con:
+                attach_database(con, self.path_to_source_db, FORMATTED_ALIAS)
+            with transaction(db_file_path) as con:
+                print(f"Writing {self.dataset_category} table in the trusted zone...")
+                con.execute(
+                    f"CREATE OR REPLACE TABLE {self.dataset_category} AS {self.query}"
+                )
+                print("Saved dataset to table")
+            return
+
+        with transaction(db_file_path) as con:
+            con.register("df_to_save", self.df)
+            if not table_exists(con, self.dataset_category):
+                print(
+                    f"Table {self.dataset_category} does not exist, creating with {len(self.df)} rows..."
+                )
+                con.execute(
+                    f"CREATE TABLE {self.dataset_category} AS SELECT * FROM df_to_save"
+                )
+                print("Saved dataset to table")
+            else:
+                print("Overwriting dataset in table")
+                con.execute(f"DROP TABLE {self.dataset_category}")
+                con.execute(
+                    f"CREATE TABLE {self.dataset_category} AS SELECT * FROM df_to_save"
+                )
+            con.unregister("df_to_save")
 
 
 class MainDataset(Dataset):
@@ -253,6 +428,13 @@ class MainDataset(Dataset):
         outlier_removal_mode: OutlierRemovalMode,
         path_to_datasets_root: str,
         cleaning_function=None,
+        streaming: bool = False,
+        batch_size: int = 100_000,
+        engine: ExecutionEngine = ExecutionEngine.PANDAS,
+        sql_cleaning_expressions: dict = None,
+        multi_outlier_detector: MultiOutlierDetector = MultiOutlierDetector.KNN,
+        multi_outlier_sample_size: int = None,
+        max_workers: int = None,
     ) -> None:
         super().__init__(
             dataset_category,
@@ -261,9 +443,21 @@ class MainDataset(Dataset):
             outlier_removal_mode,
             path_to_datasets_root,
             cleaning_function,
+            streaming,
+            batch_size,
+            engine,
+            sql_cleaning_expressions,
+            multi_outlier_detector,
+            multi_outlier_sample_size,
+            max_workers,
         )
 
     def perform_data_quality_processes(self) -> None:
+        if self.engine == ExecutionEngine.DUCKDB:
+            self._perform_sql_deduplication()
+            self._find_sql_uni_outliers(strict=True)
+            self._remove_sql_outliers()
+            return
         self._perform_deduplication()
         self._find_uni_outliers(strict=True)
         self._summarize_uni_outliers()
@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from pyod.models.knn import KNN
+from pyod.models.iforest import IForest
+from pyod.models.ecod import ECOD
+
+
+class MultiOutlierDetector(Enum):
+    KNN = 1
+    IFOREST = 2
+    ECOD = 3
+
+
+def create_detector(detector: MultiOutlierDetector, random_state: int):
+    if detector == MultiOutlierDetector.KNN:
+        return KNN()
+    if detector == MultiOutlierDetector.IFOREST:
+        return IForest(random_state=random_state)
+    if detector == MultiOutlierDetector.ECOD:
+        return ECOD()
+    raise ValueError(f"Unknown multivariate outlier detector: {detector}")
+
+
+def min_group_size(detector: MultiOutlierDetector) -> int:
+    # KNN needs more rows than neighbors, the other detectors fit groups of any size
+    if detector == MultiOutlierDetector.KNN:
+        return KNN().n_neighbors + 1
+    return 1
+
+
+def fit_predict_group(
+    values: np.ndarray,
+    detector: MultiOutlierDetector,
+    sample_size: int = None,
+    random_state: int = 0,
+) -> np.ndarray:
+    """
+    Find the multivariate outliers among the rows of one group.
+
+    Missing values are temporarily imputed by the column mean. When a sample size
+    is given and the group is larger, the detector is fitted on a random sample
+    of that size and every row is scored against it, which bounds the cost of
+    the fit regardless of the group size.
+
+    Args:
+        values (np.ndarray): The rows of the group, one column per variable.
+        detector (MultiOutlierDetector): The outlier detection algorithm.
+        sample_size (int): Maximum number of rows the detector is fitted on.
+        random_state (int): Seed of the sample and of randomized detectors.
+
+    Returns:
+        np.ndarray: Boolean outlier flag per row.
+    """
+    imputed = SimpleImputer(missing_values=np.nan, strategy="mean").fit_transform(
+        values
+    )
+    clf = create_detector(detector, random_state)
+    if sample_size is not None:
+        sample_size = max(sample_size, min_group_size(detector))
+    if sample_size is not None and len(imputed) > sample_size:
+        rng = np.random.default_rng(random_state)
+        sample = imputed[rng.choice(len(imputed), size=sample_size, replace=False)]
+        clf.fit(sample)
+        return clf.predict(imputed).astype(bool)
+    clf.fit(imputed)
+    return clf.labels_.astype(bool)
+
+
+def find_multi_outliers(
+    df: pd.DataFrame,
+    type_column: str,
+    targets: list,
+    detector: MultiOutlierDetector = MultiOutlierDetector.KNN,
+    sample_size: int = None,
+    max_workers: int = None,
+    random_state: int = 0,
+) -> pd.Series:
+    """
+    Find multivariate outliers of the target columns within each value of the type
+    column, fitting one detector per type in parallel worker processes. Groups with
+    fewer rows than the detector needs are reported and not flagged.
+
+    Args:
+        df (pd.DataFrame): The data to check.
+        type_column (str): The column a separate detector is fitted per value of.
+        targets (list): The columns the detectors are fitted on.
+        detector (MultiOutlierDetector): The outlier detection algorithm.
+        sample_size (int): Maximum number of rows each detector is fitted on.
+        max_workers (int): Number of worker processes, one per CPU when None.
+        random_state (int): Seed of the samples and of randomized detectors.
+
+    Returns:
+        pd.Series: Boolean outlier flag per row, aligned with the index of df.
+    """
+    groups = [
+        (indices, df.loc[indices, targets].to_numpy(dtype=float))
+        for indices in df.groupby(type_column).groups.values()
+    ]
+    outliers = pd.Series(False, index=df.index)
+    minimum = min_group_size(detector)
+    skipped = [values for _, values in groups if len(values) < minimum]
+    if skipped:
+        print(
+            f"Skipped {len(skipped)} group(s) with {sum(map(len, skipped))} row(s) in total, "
+            f"smaller than the {minimum} rows the {detector.name} detector needs"
+        )
+    groups = [(indices, values) for indices, values in groups if len(values) >= minimum]
+    if not groups:
+        return outliers
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        masks = executor.map(
+            fit_predict_group,
+            [values for _, values in groups],
+            [detector] * len(groups),
+            [sample_size] * len(groups),
+            [random_state] * len(groups),
+        )
+        for (indices, _), mask in zip(groups, masks):
+            outliers.loc[indices] = mask
+    return outliers
@@ -0,0 +1,164 @@
+from data_io.connections import cursor
+
+# numeric types in widening order, a column can always be cast to a later type without loss
+NUMERIC_TYPE_ORDER = ["TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "DOUBLE"]
+FLOAT_TYPES = {"FLOAT": "DOUBLE"}
+
+
+def widen_types(types: set) -> str:
+    """
+    Find the narrowest type every one of the given types can be safely cast to.
+
+    Args:
+        types (set): DuckDB type names.
+
+    Returns:
+        str: The common type, or None if there is no known-safe widening.
+    """
+    types = {FLOAT_TYPES.get(t, t) for t in types}
+    if len(types) == 1:
+        return types.pop()
+    if not types.issubset(NUMERIC_TYPE_ORDER):
+        return None
+    if "DOUBLE" in types:
+        return "DOUBLE"
+    return max(types, key=NUMERIC_TYPE_ORDER.index)
+
+
+class SchemaCheckResult:
+    """
+    Outcome of checking whether a set of tables can be merged into one.
+
+    Attributes:
+        groups (list): (schema, table names) tuples, one per distinct schema.
+        merged_schema (dict): Column name to type of the merged table, in the
+            column order of the first table.
+        widenings (dict): Column name to the type it has to be cast to.
+        missing_columns (dict): Column name to the tables that lack it.
+        type_conflicts (dict): Column name to {type: table names} for columns
+            without a known-safe widening.
+    """
+
+    def __init__(self, groups: list) -> None:
+        self.groups: list = groups
+        self.merged_schema: dict = dict()
+        self.widenings: dict = dict()
+        self.missing_columns: dict = dict()
+        self.type_conflicts: dict = dict()
+
+        all_tables = [table for _, tables in groups for table in tables]
+        types_by_column = dict()
+        for schema, tables in groups:
+            for column, data_type in schema.items():
+                types_by_column.setdefault(column, dict()).setdefault(
+                    data_type, []
+                ).extend(tables)
+
+        for column, tables_by_type in types_by_column.items():
+            tables_with_column = {
+                t for tables in tables_by_type.values() for t in tables
+            }
+            if len(tables_with_column) != len(all_tables):
+                self.missing_columns[column] = sorted(
+                    set(all_tables) - tables_with_column
+                )
+            common_type = widen_types(set(tables_by_type))
+            if common_type is None:
+                self.type_conflicts[column] = tables_by_type
+                continue
+            self.merged_schema[column] = common_type
+            if len(tables_by_type) > 1:
+                self.widenings[column] = common_type
+
+    @property
+    def table_names(self) -> list:
+        return sorted(table for _, tables in self.groups for table in tables)
+
+    @property
+    def mergeable(self) -> bool:
+        return not self.missing_columns and not self.type_conflicts
+
+    def report(self) -> None:
+        print(f"{len(self.table_names)} table(s) in {len(self.groups)} schema group(s)")
+        for column, tables in self.missing_columns.items():
+            print(f"Column '{column}' is missing in {', '.join(tables)}.")
+        for column, tables_by_type in self.type_conflicts.items():
+            types = "; ".join(
+                f"{data_type} in {', '.join(sorted(tables))}"
+                for data_type, tables in tables_by_type.items()
+            )
+            print(f"Data type for column '{column}' differs: {types}.")
+        for column, data_type in self.widenings.items():
+            print(f"Column '{column}' will be widened to {data_type}.")
+
+
+class SchemaRegistry:
+    """
+    Column names and types of the tables of a DuckDB database, read from its catalog.
+    """
+
+    def __init__(self, path_to_db: str) -> None:
+        self.path_to_db: str = path_to_db
+
+    def table_schemas(self, table_prefix: str) -> dict:
+        """
+        Read the schemas of the tables whose name starts with a prefix, in the main
+        schema of the database itself, not of databases attached to it.
+
+        Args:
+            table_prefix (str): The prefix of the table names.
+
+        Returns:
+            dict: Table name to {column name: data type}, columns in table order.
+        """
+        with cursor(self.path_to_db) as con:
+            columns = con.execute(
+                """
+                select table_name, column_name, data_type
+                from information_schema.columns
+                where table_catalog = current_database()
+                  and table_schema = 'main'
+                  and starts_with(table_name, ?)
+                order by table_name, ordinal_position
+                """,
+                [table_prefix],
+            ).fetchall()
+        schemas = dict()
+        for table_name, column_name, data_type in columns:
+            schemas.setdefault(table_name, dict())[column_name] = data_type
+        return schemas
+
+    def check(self, table_prefix: str) -> SchemaCheckResult:
+        """
+        Group the tables whose name starts with a prefix by schema fingerprint and
+        check whether the groups can be merged, in time linear in the number of tables.
+
+        Args:
+            table_prefix (str): The prefix of the table names.
+
+        Returns:
+            SchemaCheckResult: The groups and every incompatibility between them.
+        """
+        groups = dict()
+        for table_name, schema in self.table_schemas(table_prefix).items():
+            fingerprint = tuple(sorted(schema.items()))
+            groups.setdefault(fingerprint, (schema, []))[1].append(table_name)
+        return SchemaCheckResult(list(groups.values()))
+
+
+def select_with_schema(table_name: str, schema: dict) -> str:
+    """
+    Build a query selecting the columns of a table in the given order and types.
+
+    Args:
+        table_name (str): The table to select from.
+        schema (dict): Column name to the type it should have.
+
+    Returns:
+        str: The select statement.
+    """
+    columns = ", ".join(
+        f'CAST("{column}" AS {data_type}) AS "{column}"'
+        for column, data_type in schema.items()
+    )
+    return f"select {columns} from {table_name}"
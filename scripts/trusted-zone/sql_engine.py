@@ -0,0 +1,104 @@
+from data_io.data_io import quote
+
+FORMATTED_ALIAS = "formatted"
+
+
+def merged_source_query(
+    table_names: list, schema: dict, cleaning_expressions: dict = None
+) -> str:
+    """
+    Build a query merging formatted tables into one relation.
+
+    Args:
+        table_names (list): The formatted tables, attached as FORMATTED_ALIAS.
+        schema (dict): Column name to the type every table is cast to.
+        cleaning_expressions (dict): Column name to a SQL expression replacing it.
+
+    Returns:
+        str: The query.
+    """
+    cleaning_expressions = cleaning_expressions or dict()
+    columns = ", ".join(
+        f"CAST({quote(column)} AS {data_type}) AS {quote(column)}"
+        for column, data_type in schema.items()
+    )
+    union = " UNION ALL ".join(
+        f"select {columns} from {FORMATTED_ALIAS}.{table_name}"
+        for table_name in table_names
+    )
+    cleaned_columns = ", ".join(
+        (
+            f"{cleaning_expressions[column]} AS {quote(column)}"
+            if column in cleaning_expressions
+            else quote(column)
+        )
+        for column in schema
+    )
+    return f"select {cleaned_columns} from ({union})"
+
+
+def deduplicated_query(source_query: str) -> str:
+    return f"select distinct * from ({source_query})"
+
+
+def uni_outlier_flags_query(
+    source_query: str, type_column: str, targets: list, strict: bool
+) -> str:
+    """
+    Build a query adding a boolean outlier flag per target to every row, using
+    Tukey's fences computed within each value of the type column.
+
+    The flag of target t is named __outlier_t. Rows with a missing value or
+    type are never flagged, as in tm_outlier_mask.
+
+    Args:
+        source_query (str): The query of the rows to check.
+        type_column (str): The column the fences are computed per value of.
+        targets (list): The columns to check.
+        strict (bool): Use the outer fences (probable outliers) instead of the inner ones.
+
+    Returns:
+        str: The query.
+    """
+    factor = 3 if strict else 1.5
+    quartiles = ", ".join(
+        f"quantile_cont({quote(t)}, 0.25) AS {quote('__q1_' + t)}, "
+        f"quantile_cont({quote(t)}, 0.75) AS {quote('__q3_' + t)}"
+        for t in targets
+    )
+    flags = ", ".join(
+        f"coalesce("
+        f"{quote(t)} <= q.{quote('__q1_' + t)} - {factor} * (q.{quote('__q3_' + t)} - q.{quote('__q1_' + t)}) OR "
+        f"{quote(t)} >= q.{quote('__q3_' + t)} + {factor} * (q.{quote('__q3_' + t)} - q.{quote('__q1_' + t)}), "
+        f"false) AS {quote('__outlier_' + t)}"
+        for t in targets
+    )
+    return f"""
+        with source as ({source_query}),
+        quartiles as (
+            select {quote(type_column)}, {quartiles}
+            from source
+            group by {quote(type_column)}
+        )
+        select source.*, {flags}
+        from source
+        left join quartiles q on source.{quote(type_column)} = q.{quote(type_column)}
+    """
+
+
+def uni_outlier_counts_query(flags_query: str, type_column: str, targets: list) -> str:
+    counts = ", ".join(
+        f"CAST(count_if({quote('__outlier_' + t)}) AS BIGINT) AS {quote(t)}"
+        for t in targets
+    )
+    return f"""
+        select {quote(type_column)}, {counts}
+        from ({flags_query})
+        group by {quote(type_column)}
+    """
+
+
+def without_uni_outliers_query(flags_query: str, columns: list, targets: list) -> str:
+    selected = ", ".join(quote(column) for column in columns)
+    is_outlier = " OR ".join(quote("__outlier_" + t) for t in targets)
+    return f"select {selected} from ({flags_query}) where not ({is_outlier})"
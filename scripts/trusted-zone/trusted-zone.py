@@ -1,5 +1,5 @@
-from dataset import MainDataset, MetaDataset, OutlierRemovalMode
-from helper_functions import fix_valor_column
+from dataset import MainDataset, MetaDataset, OutlierRemovalMode, ExecutionEngine
+from helper_functions import fix_valor_column, VALOR_COLUMN_SQL_CLEANING
 
 datasets_root_folder = "datasets"
 path_to_formatted_db = "datasets/formatted-zone/formatted.db"
@@ -7,6 +7,9 @@ path_to_formatted_db = "datasets/formatted-zone/formatted.db"
 education_dataset_category = "education"
 education_important_columns = {"targets": ["Valor"], "type": "NIV_EDUCA_esta"}
 education_outlier_removal_mode = OutlierRemovalMode.UNI
+# set to ExecutionEngine.DUCKDB to run the data quality steps as SQL inside DuckDB,
+# with the Valor fix applied by VALOR_COLUMN_SQL_CLEANING instead of fix_valor_column
+education_engine = ExecutionEngine.PANDAS
 education_dataset = MainDataset(
     dataset_category=education_dataset_category,
     path_to_source_db=path_to_formatted_db,
@@ -14,6 +17,9 @@ education_dataset = MainDataset(
     outlier_removal_mode=education_outlier_removal_mode,
     path_to_datasets_root=datasets_root_folder,
     cleaning_function=fix_valor_column,
+    streaming=True,
+    engine=education_engine,
+    sql_cleaning_expressions=VALOR_COLUMN_SQL_CLEANING,
 )
 
 income_dataset_category = "income"
@@ -44,7 +50,8 @@ for dataset in main_datasets:
         print(e)
         print(f"Shutting down due to error in {dataset.dataset_category} dataset")
         exit()
-    print(dataset.df.head())
+    if dataset.df is not None:
+        print(dataset.df.head())
     dataset.perform_eda()
     dataset.perform_data_quality_processes()
     dataset.copy_to_trusted()